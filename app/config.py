@@ -12,6 +12,17 @@ if env.get('SETTINGS') == 'AWS':
     from lib.aws_env import env
 
 
+def env_flag(name, default):
+    """
+    A boolean setting, where "0", "false", "no" and "" are False
+    """
+
+    if name not in env:
+        return default
+
+    return env[name].lower() not in ('0', 'false', 'no', '')
+
+
 APP_NAME = env.get('APP_NAME', 'smb')
 
 PREFERRED_URL_SCHEME = 'https'
@@ -29,12 +40,18 @@ DB = {
 
 DEBUG = bool(env.get('DEBUG', True))
 
+# Skip work web workers don't need at startup: migrations are not set up,
+# asset bundles are not auto-built and OIDC discovery waits for first use
+FAST_BOOT = env_flag('FAST_BOOT', False)
+
 GOVUK_NOTIFY = {
     'disabled': 'GOVUK_NOTIFY_BASE_URL' not in env,
     'base_url': env.get('GOVUK_NOTIFY_BASE_URL'),
     'service_url': env.get('GOVUK_NOTIFY_SERVICE_URL'),
     'client_id': env.get('GOVUK_NOTIFY_SERVICE_ID'),
     'secret': env.get('GOVUK_NOTIFY_API_KEY'),
+    'pool_size': int(env.get('GOVUK_NOTIFY_POOL_SIZE', 10)),
+    'timeout': float(env.get('GOVUK_NOTIFY_TIMEOUT', 10)),
     'templates': {
         'accept': env.get('GOVUK_NOTIFY_TEMPLATE_ID_ACCEPT'),
         'sms': env.get('GOVUK_NOTIFY_TEMPLATE_ID_SMS')
@@ -44,7 +61,11 @@ GOVUK_NOTIFY = {
 GOVUK_PAY = {
     'disabled': 'GOVUK_PAY_BASE_URL' not in env,
     'base_url': env.get('GOVUK_PAY_BASE_URL'),
-    'api_key': env.get('GOVUK_PAY_API_KEY')
+    'api_key': env.get('GOVUK_PAY_API_KEY'),
+    'pool_size': int(env.get('GOVUK_PAY_POOL_SIZE', 10)),
+    'connect_timeout': float(env.get('GOVUK_PAY_CONNECT_TIMEOUT', 3.05)),
+    'read_timeout': float(env.get('GOVUK_PAY_READ_TIMEOUT', 10)),
+    'retries': int(env.get('GOVUK_PAY_RETRIES', 2)),
 }
 
 OIDC_CLIENT = {
@@ -56,6 +77,17 @@ OIDC_CLIENT = {
 # XXX This should be True when served over HTTPS
 OIDC_COOKIE_SECURE = False
 
+# Provider metadata and keys are cached here, shared by all workers
+OIDC_DISCOVERY_CACHE_DIR = env.get(
+    'OIDC_DISCOVERY_CACHE_DIR', '/tmp/smb-oidc-discovery')
+
+# Seconds before cached provider metadata and keys are revalidated
+OIDC_DISCOVERY_TTL = int(env.get('OIDC_DISCOVERY_TTL', 3600))
+
+# Seconds between background checks for stale metadata, 0 to disable
+OIDC_DISCOVERY_REFRESH_INTERVAL = int(
+    env.get('OIDC_DISCOVERY_REFRESH_INTERVAL', 300))
+
 OIDC_GOOGLE_APPS_DOMAIN = env.get('OIDC_GOOGLE_APPS_DOMAIN')
 
 SECRET_KEY = env.get(
@@ -74,8 +106,37 @@ if all(DB.values()):
 if 'DATABASE_URL' in env:
     SQLALCHEMY_DATABASE_URI = env.get('DATABASE_URL')
 
+# Connection pool, for Postgres only as SQLite connections aren't pooled.
+# Pre-ping and recycling replace connections dropped by the server.
+if SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(env.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(env.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(env.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(env.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': env_flag('DB_POOL_PRE_PING', True),
+    }
+
+# Prometheus metrics are served here, if set. For multi-process servers
+# also set PROMETHEUS_MULTIPROC_DIR in the environment.
+METRICS_URL = env.get('METRICS_URL', '/metrics')
+
+# Query counts, times and the slowest statements per endpoint are served
+# here, if set. Off by default as they show the SQL.
+QUERY_STATS_URL = env.get('QUERY_STATS_URL')
+
+# Metrics are only served to clients on these networks
+INTERNAL_NETWORKS = env.get(
+    'INTERNAL_NETWORKS', '127.0.0.0/8,::1/128').split(',')
+
+# Raise instead of logging when a view runs more queries than its budget
+QUERY_BUDGET_STRICT = env_flag('QUERY_BUDGET_STRICT', False)
+
 ACCEPT_SUIT_MAX_AGE = 300
 
+# Number of rows per page on admin listings
+ADMIN_PAGE_SIZE = int(env.get('ADMIN_PAGE_SIZE', 50))
+
 # XXX Don't change the following settings unless necessary
 
 # Skips concatenation of bundles if True, which breaks everything
@@ -85,48 +146,125 @@ ASSETS_LOAD_PATH = [
     'app/static',
     'app/templates']
 
+# "compressed" for smaller stylesheets in production
+SASS_OUTPUT_STYLE = env.get('SASS_OUTPUT_STYLE', 'expanded')
+
+# Compiled Sass is cached here by a hash of its inputs, can be shared
+SASS_CACHE_DIR = env.get(
+    'SASS_CACHE_DIR',
+    os.path.join(os.path.dirname(__file__), 'static', '.sass-cache'))
+
+# Prebuilt bundles and their manifest, see "manage.py build_assets"
+ASSETS_OUTPUT_DIR = env.get(
+    'ASSETS_OUTPUT_DIR',
+    os.path.join(os.path.dirname(__file__), 'static', 'dist'))
+
+# Prebuilt bundles have content-hashed names so can be cached indefinitely
+ASSETS_MAX_AGE = int(env.get('ASSETS_MAX_AGE', 365 * 24 * 60 * 60))
+
+# "production" logs JSON lines at INFO, "development" plain text at DEBUG.
+# LOG_LEVEL and LOG_FORMATTER ("json" or "default") override the profile.
+LOG_PROFILE = env.get('LOG_PROFILE', 'development')
+LOG_LEVEL = env.get(
+    'LOG_LEVEL', 'INFO' if LOG_PROFILE == 'production' else 'DEBUG')
+LOG_FORMATTER = env.get(
+    'LOG_FORMATTER', 'json' if LOG_PROFILE == 'production' else 'default')
+
+# Handlers run on a background thread, so requests don't wait on writes
+LOG_QUEUE = env_flag('LOG_QUEUE', True)
+
 LOGGING = {
     'version': 1,
     'formatters': {
         'default': {
             'format': '%(name)s [%(levelname)s] %(message)s'
-        }
+        },
+        'json': {
+            '()': 'lib.log_queue.JSONFormatter',
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
-            'formatter': 'default',
-            'level': 'DEBUG'
+            'formatter': LOG_FORMATTER,
+            'level': LOG_LEVEL,
         },
         'file': {
             'class': 'logging.FileHandler',
-            'formatter': 'default',
-            'level': 'DEBUG',
-            'filename': '/tmp/gateway.log',
+            'formatter': LOG_FORMATTER,
+            'level': LOG_LEVEL,
+            'filename': env.get('LOG_FILE', '/tmp/gateway.log'),
         }
     },
     'loggers': {
         'app.factory': {
             'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
         },
         'waitress': {
             'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
         }
     },
     'root': {
-        'level': 'DEBUG',
+        'level': LOG_LEVEL,
         'handlers': ['console', 'file'],
     },
 }
 
+# Entries kept in each worker's in-process cache
+CACHE_SIZE = int(env.get('CACHE_SIZE', 1024))
+
+# Seconds before in-process entries expire. Invalidations only clear the
+# worker that made them, so this is how long the others may be stale.
+CACHE_LOCAL_TTL = int(env.get('CACHE_LOCAL_TTL', 5))
+
+# Optional Redis cache shared by all workers, whose entries are reloaded
+# after CACHE_TTL seconds
+CACHE_REDIS_URL = env.get('CACHE_REDIS_URL')
+CACHE_TTL = int(env.get('CACHE_TTL', 300))
+
+# Seconds between keepalives on /status/<suit>/events, and before the
+# stream ends and the browser reconnects
+STATUS_EVENTS_KEEPALIVE = int(env.get('STATUS_EVENTS_KEEPALIVE', 15))
+STATUS_EVENTS_MAX_AGE = int(env.get('STATUS_EVENTS_MAX_AGE', 300))
+
+# Each open stream holds a worker thread, so each process keeps at most
+# PUBSUB_MAX_SUBSCRIBERS open. Past that, browsers poll every
+# STATUS_EVENTS_POLL_INTERVAL seconds instead.
+PUBSUB_MAX_SUBSCRIBERS = int(env.get('PUBSUB_MAX_SUBSCRIBERS', 4))
+STATUS_EVENTS_POLL_INTERVAL = int(env.get('STATUS_EVENTS_POLL_INTERVAL', 10))
+
+# Suit changes reach streams in other worker processes through Postgres
+# LISTEN/NOTIFY. Without it, those streams only see a change when the
+# browser reconnects.
+PUBSUB_POSTGRES_URL = env.get(
+    'PUBSUB_POSTGRES_URL',
+    SQLALCHEMY_DATABASE_URI
+    if SQLALCHEMY_DATABASE_URI.startswith('postgres') else None)
+
+# Compiled templates are cached here, shared by all workers. Must be owned
+# by the app's user and closed to others, unset to disable.
+JINJA_CACHE_DIR = env.get('JINJA_CACHE_DIR', '/tmp/smb-jinja-cache')
+
+# Reuse {% cache %} blocks in templates, turn off when editing templates
+TEMPLATE_FRAGMENT_CACHE = env_flag('TEMPLATE_FRAGMENT_CACHE', True)
+
 # Calculate friendly times using UTC instead of local timezone
 HUMANIZE_USE_UTC = True
 
 SECURITY_PASSWORD_HASH = 'bcrypt'
 SECURITY_PASSWORD_SALT = SECRET_KEY
 
+# Where session data is kept: "database", "file" (in SESSION_FILE_DIR) or
+# "cookie". Server-side sessions keep only a session id in the cookie.
+SESSION_BACKEND = env.get('SESSION_BACKEND', 'database')
+
+SESSION_FILE_DIR = env.get('SESSION_FILE_DIR', '/tmp/smb-sessions')
+
+# Chance of removing expired sessions when a session is saved
+SESSION_PURGE_PROBABILITY = float(env.get('SESSION_PURGE_PROBABILITY', 0.01))
+
 # TODO this should be True when served via HTTPS
 SESSION_COOKIE_SECURE = False
 
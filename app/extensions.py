@@ -9,8 +9,14 @@ from sqlalchemy import MetaData, event
 from sqlalchemy.engine import Engine
 from sqlite3 import Connection as SQLite3Connection
 
+from lib.asset_manifest import AssetManifest
+from lib.cache import Cache
 from lib.notify import Notify
 from lib.pay import Pay
+from lib.prometheus_metrics import Metrics
+from lib.pubsub import PubSub
+from lib.query_stats import QueryStats
+from lib.server_session import ServerSession
 
 
 @event.listens_for(Engine, 'connect')
@@ -30,8 +36,21 @@ naming_convention = {
     'pk': 'pk_%(table_name)s'}
 db = SQLAlchemy(metadata=MetaData(naming_convention=naming_convention))
 
+assets_manifest = AssetManifest()
+
+cache = Cache()
+
 notify = Notify()
 
 user_datastore = SQLAlchemyUserDatastore(db, None, None)
 
 pay = Pay()
+
+metrics = Metrics()
+
+query_stats = QueryStats()
+
+server_session = ServerSession()
+
+# suit id -> changes to that suit, see app.main.views.suit_changed
+suit_events = PubSub()
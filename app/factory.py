@@ -3,8 +3,11 @@
 Sue My Brother app factory class
 """
 
-import logging.config
+from collections import OrderedDict
+import contextlib
+import functools
 import os
+import time
 
 from flask import Flask, render_template
 
@@ -17,10 +20,14 @@ def create_app(config='config.py', **kwargs):
     app = Flask(__name__)
     app.config.from_pyfile(config)
     app.config.update(kwargs)
+    app.startup_timings = OrderedDict()
 
-    configure_logger(app)
+    with timed(app, 'logging'):
+        configure_logger(app)
+
+    with timed(app, 'blueprints'):
+        register_blueprints(app)
 
-    register_blueprints(app)
     register_context_processors(app)
     register_error_handlers(app)
     register_extensions(app)
@@ -28,9 +35,18 @@ def create_app(config='config.py', **kwargs):
     return app
 
 
+@contextlib.contextmanager
+def timed(app, name):
+    start = time.perf_counter()
+    yield
+    app.startup_timings[name] = time.perf_counter() - start
+
+
 def configure_logger(app):
+    from lib.log_queue import configure_logging
     app.logger
-    logging.config.dictConfig(app.config.get('LOGGING', {}))
+    configure_logging(
+        app.config.get('LOGGING', {}), app.config.get('LOG_QUEUE', True))
 
 
 def register_blueprints(app):
@@ -69,9 +85,13 @@ def register_error_handlers(app):
 
     def make_handler(code, template):
         template = os.path.join('errors', template)
+        rendered = {}
 
+        # error pages don't vary between requests, so render them once
         def handler(e):
-            return render_template(template, code=code), code
+            if code not in rendered:
+                rendered[code] = render_template(template, code=code)
+            return rendered[code], code
 
         return handler
 
@@ -82,12 +102,29 @@ def register_error_handlers(app):
 
 def register_extensions(app):
     """
-    Import and register flask extensions and initialize with app object
+    Import and register flask extensions and initialize with app object,
+    recording how long each one takes in app.startup_timings
     """
 
+    for name, init_extension in EXTENSIONS:
+        with timed(app, name):
+            init_extension(app)
+
+
+def init_assets(app):
+
+    # bundles without a prebuilt manifest entry (see "manage.py build_assets")
+    # must be built ahead of time rather than checked and built on render
+    if app.config.get('FAST_BOOT'):
+        app.config.setdefault('ASSETS_AUTO_BUILD', False)
+
     from app.assets import env
+    from app.extensions import assets_manifest
     env.init_app(app)
+    assets_manifest.init_app(app, env)
+
 
+def init_db(app):
     from app.extensions import db
     db.init_app(app)
     # XXX avoids "RuntimeError: application not registered on db instance and
@@ -95,35 +132,115 @@ def register_extensions(app):
     # context
     db.app = app
 
+
+def init_query_stats(app):
+    from app.extensions import query_stats
+    query_stats.init_app(app)
+
+
+def init_migrate(app):
+
+    # web workers never run migrations
+    if app.config.get('FAST_BOOT'):
+        return
+
     from flask_migrate import Migrate
+    from sqlalchemy.engine.url import make_url
     from sqlalchemy.exc import ArgumentError
-    migrate = Migrate()
+    from app.extensions import db
+
     # XXX SQLite chokes on constraint changes without this
-    with app.app_context():
-        try:
-            render_as_batch = db.engine.url.drivername == 'sqlite'
+    try:
+        drivername = make_url(app.config['SQLALCHEMY_DATABASE_URI']).drivername
+        render_as_batch = drivername.startswith('sqlite')
+
+    # XXX this happens during a test
+    except ArgumentError:
+        render_as_batch = True
 
-        # XXX this happens during a test
-        except ArgumentError:
-            render_as_batch = True
+    Migrate(app, db, render_as_batch=render_as_batch)
 
-        migrate.init_app(app, db, render_as_batch=bool(render_as_batch))
 
+def init_cache(app):
+    from app.extensions import cache
+    cache.init_app(app)
+
+
+def init_suit_events(app):
+    from app.extensions import suit_events
+    suit_events.init_app(app)
+
+
+def init_sessions(app):
+    from app.extensions import server_session
+    server_session.init_app(app)
+
+
+def init_templates(app):
+    from lib.template_cache import FragmentCacheExtension, SharedBytecodeCache
+
+    if app.config.get('JINJA_CACHE_DIR'):
+        app.jinja_env.bytecode_cache = SharedBytecodeCache(
+            app.config['JINJA_CACHE_DIR'])
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache_enabled = app.config.get(
+        'TEMPLATE_FRAGMENT_CACHE', True)
+
+
+def init_humanize(app):
     from flask_humanize import Humanize
     Humanize(app)
 
+
+def init_security(app):
     from flask_security import Security
     from app.extensions import user_datastore
+    from app.main.identity import load_user
     from app.main.models import AnonymousUser, Role, User
     user_datastore.role_model = Role
     user_datastore.user_model = User
     Security(app, user_datastore, anonymous_user=AnonymousUser)
+    # load roles with the user, instead of lazily on first has_role()
+    app.extensions['security'].login_manager.user_loader(load_user)
+
 
+def init_notify(app):
     from app.extensions import notify
     notify.init_app(app)
 
+
+def init_oidc(app):
     from app.oidc_client import OIDCClient
-    OIDCClient(app)
+    OIDCClient(app, lazy=app.config.get('FAST_BOOT', False))
+
 
+def init_pay(app):
     from app.extensions import pay
     pay.init_app(app)
+
+
+def init_metrics(app):
+    from app.extensions import metrics, notify, pay
+    metrics.init_app(app)
+    metrics.instrument_session(notify.session, 'notify')
+    # per endpoint rather than per HTTP method
+    pay.timer = functools.partial(metrics.external_timer, 'pay')
+
+
+EXTENSIONS = (
+    ('assets', init_assets),
+    ('db', init_db),
+    ('query_stats', init_query_stats),
+    ('migrate', init_migrate),
+    ('cache', init_cache),
+    ('suit_events', init_suit_events),
+    ('sessions', init_sessions),
+    ('templates', init_templates),
+    ('humanize', init_humanize),
+    ('security', init_security),
+    ('notify', init_notify),
+    ('oidc', init_oidc),
+    ('pay', init_pay),
+    ('metrics', init_metrics),
+)
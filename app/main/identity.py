@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Request-scoped identity cache
+"""
+
+from flask import g, session
+from flask_login import user_logged_in, user_logged_out
+from flask_security import current_user
+from sqlalchemy.orm import joinedload
+
+from .models import User
+
+
+def load_user(user_id):
+    """
+    Flask-Login user loader, fetching the user, their roles and permission
+    flags in a single query
+    """
+
+    try:
+        user_id = int(user_id)
+
+    except (TypeError, ValueError):
+        return None
+
+    return User.query.options(joinedload(User.roles)).get(user_id)
+
+
+def get_current_user():
+    """
+    The logged in user, or an anonymous user populated from the session,
+    built once per request
+    """
+
+    if 'current_user' not in g:
+        user = current_user._get_current_object()
+
+        if not user.is_authenticated:
+            if 'user' in session and session['user']:
+                user.update(**session['user'])
+
+        g.current_user = user
+
+    return g.current_user
+
+
+def set_current_user(user):
+    if user and not user.is_authenticated:
+        session['user'] = {
+            'email': user.email,
+            'mobile': user.mobile,
+            'name': user.name}
+
+    g.current_user = user
+
+
+@user_logged_in.connect
+@user_logged_out.connect
+def forget_current_user(sender, **extra):
+    g.pop('current_user', None)
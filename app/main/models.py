@@ -4,6 +4,7 @@ Base models
 """
 
 import datetime
+import json
 
 from flask import abort
 from flask_security import (
@@ -11,8 +12,13 @@ from flask_security import (
     RoleMixin,
     UserMixin)
 
-from app.extensions import db, pay
-from lib.model_utils import GetOr404Mixin, GetOrCreateMixin, UpdateMixin
+from app.extensions import db, notify, pay, server_session
+from lib.model_utils import (
+    GetOr404Mixin,
+    GetOrCreateMixin,
+    UpdateMixin,
+    commit)
+from lib.notify import OutboxMixin
 from lib.pay import PaymentMixin
 
 
@@ -29,6 +35,16 @@ class Role(db.Model, RoleMixin):
 
 
 class User(db.Model, UserMixin, GetOrCreateMixin, GetOr404Mixin, UpdateMixin):
+    # prefix searches on the admin users page
+    __table_args__ = (
+        db.Index(
+            'ix_user_email_prefix', 'email',
+            postgresql_ops={'email': 'text_pattern_ops'}),
+        db.Index(
+            'ix_user_name_prefix', 'name',
+            postgresql_ops={'name': 'text_pattern_ops'}),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     subject_id = db.Column(db.String(255), nullable=True)
     issuer_id = db.Column(db.String, nullable=True)
@@ -69,6 +85,10 @@ class AnonymousUser(BaseAnonymousUser):
 
 
 class Suit(db.Model, GetOrCreateMixin, GetOr404Mixin, UpdateMixin):
+    __table_args__ = (
+        db.Index('ix_suit_created_id', 'created', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     plaintiff_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     plaintiff = db.relationship(
@@ -85,7 +105,14 @@ class Suit(db.Model, GetOrCreateMixin, GetOr404Mixin, UpdateMixin):
 
     def save(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
+
+
+# serves current_suit(): a plaintiff's suits, newest first
+db.Index(
+    'ix_suit_plaintiff_id_created',
+    Suit.plaintiff_id,
+    Suit.created.desc())
 
 
 @pay.payment_class
@@ -106,4 +133,54 @@ class Payment(db.Model, GetOrCreateMixin, UpdateMixin, PaymentMixin):
 
     def save(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
+
+
+@notify.outbox_class
+class OutboundNotification(db.Model, OutboxMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(50))
+    payload = db.Column(db.Text)
+    created = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    next_attempt = db.Column(
+        db.DateTime, default=datetime.datetime.utcnow, index=True)
+    attempts = db.Column(db.Integer, default=0)
+    sent = db.Column(db.DateTime, nullable=True)
+    failed = db.Column(db.Boolean, default=False)
+    error = db.Column(db.String(255), nullable=True)
+
+    @classmethod
+    def enqueue(cls, endpoint, data):
+        """
+        Stage a notification in the current transaction, without committing
+        """
+        message = cls(endpoint=endpoint, payload=json.dumps(data))
+        db.session.add(message)
+        return message
+
+    @classmethod
+    def enqueue_many(cls, endpoint, payloads):
+        """
+        Stage many notifications as a single multi-row insert, without
+        committing
+        """
+        db.session.bulk_insert_mappings(cls, [
+            {'endpoint': endpoint, 'payload': json.dumps(data)}
+            for data in payloads])
+        return len(payloads)
+
+    @classmethod
+    def due(cls, limit):
+        return cls.query.filter(
+            cls.sent.is_(None),
+            cls.failed.isnot(True),
+            cls.next_attempt <= datetime.datetime.utcnow()
+        ).order_by(cls.next_attempt).limit(limit).with_for_update(
+            skip_locked=True).all()
+
+
+@server_session.model_class
+class StoredSession(db.Model):
+    sid = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text)
+    expires = db.Column(db.DateTime, index=True)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Background jobs, run from manage.py
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import logging
+import time
+
+from app.extensions import db, notify, pay
+from app.main.models import OutboundNotification, Payment
+from lib.model_utils import keyset_paginate
+
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_notifications(batch_size=100, max_workers=10):
+    """
+    Send one batch of due notifications from the outbox, returning the number
+    of messages attempted
+    """
+
+    messages = OutboundNotification.due(batch_size)
+
+    if messages:
+        notify.dispatch(messages, max_workers=max_workers)
+
+    # also releases the row locks taken by due()
+    db.session.commit()
+
+    return len(messages)
+
+
+def reconcile_payments(chunk_size=500, max_workers=10):
+    """
+    Refresh the status of every unfinished payment from GOV.UK Pay, a chunk
+    at a time, returning throughput and lag statistics
+    """
+
+    unfinished = db.session.query(
+        Payment.reference, Payment.url, Payment.created
+    ).filter(Payment.finished.isnot(True), Payment.url.isnot(None))
+
+    stats = ReconciliationStats()
+    cursor = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        while True:
+            chunk = keyset_paginate(
+                unfinished, [Payment.reference], cursor, chunk_size)
+
+            states = executor.map(
+                fetch_payment_state, [row.url for row in chunk])
+
+            updates = []
+
+            for row, state in zip(chunk, states):
+                stats.checked(row, state)
+
+                if state is not None:
+                    updates.append({
+                        'reference': row.reference,
+                        'status': state['status'],
+                        'finished': state['finished'],
+                        'status_msg': state.get('message', '')})
+
+            db.session.bulk_update_mappings(Payment, updates)
+            db.session.commit()
+            stats.updated += len(updates)
+
+            if not chunk.has_next:
+                break
+
+            cursor = chunk.next_cursor
+
+    return stats.finish()
+
+
+def fetch_payment_state(payment_url):
+    try:
+        return pay.fetch_state(payment_url)
+
+    except Exception:
+        logger.exception('Fetching %s failed', payment_url)
+        return None
+
+
+class ReconciliationStats(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.now = datetime.datetime.utcnow()
+        self.total = 0
+        self.updated = 0
+        self.errors = 0
+        self.finished = 0
+        self.lags = []
+
+    def checked(self, row, state):
+        self.total += 1
+
+        if state is None:
+            self.errors += 1
+
+        elif state['finished']:
+            self.finished += 1
+
+        if row.created:
+            self.lags.append((self.now - row.created).total_seconds())
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+
+        return {
+            'checked': self.total,
+            'updated': self.updated,
+            'finished': self.finished,
+            'errors': self.errors,
+            'elapsed': elapsed,
+            'per_second': self.total / elapsed if elapsed else 0.0,
+            'mean_lag': sum(self.lags) / len(self.lags) if self.lags else 0.0,
+            'max_lag': max(self.lags) if self.lags else 0.0,
+        }
@@ -1,4 +1,6 @@
 import datetime
+import hashlib
+import json
 import time
 from urllib.parse import urlparse, urlunparse
 import uuid
@@ -8,10 +10,15 @@ from flask import (
     abort,
     current_app,
     flash,
+    g,
+    make_response,
     redirect,
     render_template,
     request,
+    request_started,
+    Response,
     session,
+    stream_with_context,
     url_for)
 from flask_security import (
     current_user,
@@ -19,35 +26,38 @@ from flask_security import (
     login_user,
     logout_user,
     roles_required)
-from sqlalchemy import desc
+from sqlalchemy import desc, or_
+from sqlalchemy.orm import aliased, joinedload, selectinload
 
 from .forms import DetailsForm, SuitForm
+from .identity import get_current_user, set_current_user
 from .models import Suit, User
 from .permissions import (
     accept_suit_permission,
     make_admin_permission,
 )
-from app.extensions import db, notify, pay, user_datastore
+from app.extensions import (
+    cache, db, notify, pay, suit_events, user_datastore)
 from app.main import main
 from app import oidc_client
+from lib.model_utils import keyset_paginate, unit_of_work
+from lib.pubsub import SubscriberLimitReached
+from lib.query_stats import query_budget
 
 
-def get_current_user():
-    user = current_user
+SUIT_CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
 
-    if not user.is_authenticated:
-        if 'user' in session and session['user']:
-            user.update(**session['user'])
-
-    return user
+# ids per IN (...) list, below SQLite's limit on bound parameters
+BULK_CHUNK_SIZE = 500
 
 
-def set_current_user(user):
-    if user and not user.is_authenticated:
-        session['user'] = {
-            'email': user.email,
-            'mobile': user.mobile,
-            'name': user.name}
+@request_started.connect
+def reset_request_cache(sender=None, **extra):
+    # g outlives the request if an app context was already pushed, as in
+    # tests. Cleared on request_started, as Flask-Principal's before_request
+    # hook loads the identity, and so the current user, before any of ours.
+    for key in ('current_user', 'current_suits'):
+        g.pop(key, None)
 
 
 def sanitize_url(url):
@@ -107,7 +117,7 @@ def login():
 @main.route('/logout')
 def logout():
     logout_user()
-    set_current_user(current_user)
+    set_current_user(current_user._get_current_object())
     return redirect(url_for('.index'))
 
 
@@ -131,12 +141,50 @@ def add_role(role, user):
 
 
 def current_suit(user):
-    return Suit.query.join(User, Suit.plaintiff_id == User.id).filter(
-        User.email == user.email
-    ).order_by(desc(Suit.created)).first()
+    """
+    Most recent suit brought by `user`, memoized for the rest of the request
+    """
+
+    user_id = getattr(user, 'id', None)
+
+    if user_id is not None:
+        key = ('id', user_id)
+
+    elif user.email:
+        key = ('email', user.email)
+
+    else:
+        # XXX matching on a NULL email would find every email-less user
+        return None
+
+    if 'current_suits' not in g:
+        g.current_suits = {}
+
+    if key not in g.current_suits:
+        g.current_suits[key] = Suit.query.filter(
+            Suit.plaintiff_id == plaintiff_id(user)
+        ).order_by(desc(Suit.created)).first()
+
+    return g.current_suits[key]
+
+
+def plaintiff_id(user):
+    user_id = getattr(user, 'id', None)
+
+    if user_id is not None:
+        return user_id
+
+    # resolved in the same query as the suit, as a scalar subquery
+    return db.session.query(User.id).filter(
+        User.email == user.email).as_scalar()
+
+
+def forget_current_suit():
+    g.pop('current_suits', None)
 
 
 @main.route('/')
+@query_budget(4)
 def index():
     suit = current_suit(get_current_user())
     if suit:
@@ -195,16 +243,20 @@ def start_suit():
     user = get_current_user()
 
     if form.validate_on_submit():
-        plaintiff, _ = User.get_or_create(email=user.email)
-        if user.name:
-            plaintiff.name = user.name
-        brother, _ = User.get_or_create(name=form.brothers_name.data)
 
-        if form.brothers_mobile.data:
-            brother.update(mobile=form.brothers_mobile.data)
+        with unit_of_work():
+            plaintiff, _ = User.get_or_create(email=user.email)
+            if user.name:
+                plaintiff.name = user.name
+            brother, _ = User.get_or_create(name=form.brothers_name.data)
+
+            if form.brothers_mobile.data:
+                brother.update(mobile=form.brothers_mobile.data)
 
-        suit = Suit(plaintiff=plaintiff, defendant=brother)
-        suit.save()
+            suit = Suit(plaintiff=plaintiff, defendant=brother)
+            suit.save()
+
+        forget_current_suit()
 
         return redirect(url_for('.make_payment'))
 
@@ -228,11 +280,14 @@ def make_payment():
                 plaintiff=suit.plaintiff.name,
                 defendant=suit.defendant.name)
 
-        payment = pay.create_payment(100, description, return_url)
+        with unit_of_work():
+            payment = pay.create_payment(100, description, return_url)
+            suit.update(payment=payment)
 
-        session[uid] = payment.reference
+        # XXX not paid until confirmed, see confirm
+        forget_suit_status(suit.id)
 
-        suit.update(payment=payment)
+        session[uid] = payment.reference
 
         return redirect(payment.next_url)
 
@@ -246,24 +301,227 @@ def confirm(uid):
     if uid not in session or session[uid] != suit.payment.reference:
         abort(404)
 
-    pay.update_status(suit.payment)
+    # one key per payment attempt, no longer needed
+    session.pop(uid)
+
+    with unit_of_work():
+        pay.update_status(suit.payment)
+
+        if suit.defendant.mobile:
+            notify['sms'].queue_sms(
+                suit.defendant.mobile,
+                plaintiff=suit.plaintiff.name)
 
-    suit.update(confirmed=datetime.datetime.utcnow())
+        suit.update(confirmed=datetime.datetime.utcnow())
 
-    if suit.defendant.mobile:
-        notify['sms'].send_sms(
-            suit.defendant.mobile,
-            plaintiff=suit.plaintiff.name)
+    suit_changed(suit.id, 'paid')
 
     flash('Payment successful. Lawsuit filed.')
 
     return redirect(url_for('.status', suit=suit.id))
 
 
-@main.route('/status/<suit>')
+def load_suit_status(suit_id):
+    suit = Suit.query.options(joinedload(Suit.defendant)).get(suit_id)
+
+    if suit:
+        return {
+            'id': suit.id,
+            'created': suit.created,
+            'confirmed': suit.confirmed,
+            'accepted': suit.accepted,
+            'payment_id': suit.payment_id,
+            'defendant_name': suit.defendant.name if suit.defendant else None,
+        }
+
+
+def suit_status(suit_id):
+    """
+    What the status page shows about a suit, cached until the suit changes,
+    see forget_suit_status
+    """
+
+    return cache.get_or_set(
+        'suit-status:{}'.format(suit_id),
+        lambda: load_suit_status(suit_id))
+
+
+def forget_suit_status(suit_id):
+    cache.delete('suit-status:{}'.format(suit_id))
+
+
+def user_suit_ids(user):
+    """
+    The suits a user is party to, whose statuses must be forgotten after a
+    change to the user is committed, as they show the defendant's name
+    """
+
+    return [suit_id for suit_id, in db.session.query(Suit.id).filter(or_(
+        Suit.plaintiff_id == user.id, Suit.defendant_id == user.id))]
+
+
+def suit_changed(suit_id, event):
+    """
+    Call after committing a change to a suit, to refresh its status page and
+    notify anyone waiting on /status/<suit>/events
+    """
+
+    suits_changed([suit_id], event)
+
+
+def suits_changed(suit_ids, event):
+    """
+    As suit_changed, for many suits, publishing the events in one batch
+    """
+
+    for suit_id in suit_ids:
+        forget_suit_status(suit_id)
+
+    suit_events.publish_many([int(suit_id) for suit_id in suit_ids], event)
+
+
+def status_label(suit):
+    if suit['accepted']:
+        return 'Accepted for review'
+
+    if not suit['payment_id']:
+        return 'Awaiting payment confirmation'
+
+    return 'Awaiting review'
+
+
+def status_etag(suit):
+    """
+    Identifies everything the status page shows that can change: the suit's
+    progress, the relative times rendered and who is looking at it
+    """
+
+    humanize_filter = current_app.jinja_env.filters['humanize']
+    auth_time = session.get('id_token', {}).get('iat')
+
+    parts = (
+        suit['id'],
+        suit['confirmed'],
+        suit['accepted'],
+        suit['payment_id'],
+        suit['defendant_name'],
+        humanize_filter(suit['created']),
+        current_user.get_id() if current_user.is_authenticated else None,
+        pretty_date(auth_time) if auth_time else None)
+
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+@main.route('/status/<int:suit>')
+@query_budget(2)
 def status(suit):
-    suit = Suit.get_or_404(id=suit)
-    return render_template('status.html', suit=suit)
+    suit = suit_status(suit)
+
+    if suit is None:
+        abort(404)
+
+    etag = status_etag(suit)
+
+    # flashed messages are only shown once, so the page must be rendered
+    if etag in request.if_none_match and '_flashes' not in session:
+        response = make_response('', 304)
+
+    else:
+        response = make_response(render_template(
+            'status.html', suit=suit, label=status_label(suit)))
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    return response
+
+
+def server_sent_event(event, data):
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data))
+
+
+def status_event(status):
+    # accepted is final, so the browser can stop listening
+    return server_sent_event('status', {
+        'status': status_label(status),
+        'final': bool(status['accepted'])})
+
+
+@main.route('/status/<int:suit>/events')
+def status_events(suit):
+    """
+    Server-sent events stream of changes to a suit's status, so the status
+    page can wait for news instead of being reloaded
+    """
+
+    status = suit_status(suit)
+
+    if status is None:
+        abort(404)
+
+    keepalive = current_app.config.get('STATUS_EVENTS_KEEPALIVE', 15)
+    max_age = current_app.config.get('STATUS_EVENTS_MAX_AGE', 300)
+
+    # subscribe before letting go of the database, so no change is missed
+    try:
+        subscription = suit_events.subscribe(suit)
+
+    # XXX every open stream holds a worker thread, so past the limit the
+    # browser polls instead, reconnecting every STATUS_EVENTS_POLL_INTERVAL
+    except SubscriberLimitReached:
+        poll_interval = current_app.config.get(
+            'STATUS_EVENTS_POLL_INTERVAL', 10)
+        return event_stream([
+            'retry: {}\n\n'.format(poll_interval * 1000),
+            status_event(status)])
+
+    db.session.remove()
+
+    def stream(status):
+        deadline = time.monotonic() + max_age
+
+        with subscription:
+            yield 'retry: {}\n\n'.format(keepalive * 1000)
+            yield status_event(status)
+
+            while not status['accepted'] and time.monotonic() < deadline:
+                event = subscription.get(timeout=keepalive)
+
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+
+                if event == 'rejected':
+                    yield server_sent_event(
+                        'rejected', {'status': 'Rejected', 'final': True})
+                    return
+
+                # XXX the change may have been made by another process,
+                # whose invalidation did not reach this one's cache
+                forget_suit_status(suit)
+                status = suit_status(suit)
+                db.session.remove()
+
+                if status is None:
+                    return
+
+                yield status_event(status)
+
+    response = event_stream(stream_with_context(stream(status)))
+
+    # XXX the generator only closes the subscription once it has started,
+    # and a client may go before the first event is sent
+    response.call_on_close(subscription.close)
+
+    return response
+
+
+def event_stream(events):
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @main.app_template_filter("prettydate")
@@ -282,14 +540,44 @@ def admin():
 @main.route('/admin/suits')
 @login_required
 @roles_required('admin')
+@query_budget(4)
 def admin_suits():
-    suits = Suit.query.all()
+    query = Suit.query.options(
+        joinedload(Suit.plaintiff),
+        joinedload(Suit.defendant),
+        joinedload(Suit.payment))
+
+    suits = keyset_paginate(
+        query,
+        [Suit.created, Suit.id],
+        cursor=parse_suit_cursor(request.args.get('after')),
+        per_page=current_app.config.get('ADMIN_PAGE_SIZE', 50))
+
     return render_template(
         'admin/suits.html',
         suits=suits,
+        next_cursor=format_suit_cursor(suits.next_cursor),
         can_accept_suit=accept_suit_permission.can())
 
 
+def format_suit_cursor(cursor):
+    if cursor:
+        created, suit_id = cursor
+        return '{}.{}'.format(created.strftime(SUIT_CURSOR_FORMAT), suit_id)
+
+
+def parse_suit_cursor(cursor):
+    if cursor:
+        try:
+            created, suit_id = cursor.split('.')
+            return (
+                datetime.datetime.strptime(created, SUIT_CURSOR_FORMAT),
+                int(suit_id))
+
+        except ValueError:
+            abort(400)
+
+
 @main.route('/admin/suits/<suit>/accept', methods=['GET', 'POST'])
 @login_required
 @roles_required('admin')
@@ -303,13 +591,15 @@ def accept(suit):
 
     suit_obj.accepted = datetime.datetime.utcnow()
     db.session.add(suit_obj)
-    db.session.commit()
 
-    notify['accept'].send_email(
+    notify['accept'].queue_email(
         suit_obj.plaintiff.email,
         plaintiff=suit_obj.plaintiff.name,
         defendant=suit_obj.defendant.name)
 
+    db.session.commit()
+    suit_changed(suit_obj.id, 'accepted')
+
     flash('Suit accepted')
     return redirect(url_for('.admin'))
 
@@ -319,26 +609,168 @@ def accept(suit):
 @roles_required('admin')
 @accept_suit_permission.require()
 def reject(suit):
-    suit = Suit.query.get(suit)
-    db.session.delete(suit)
+    suit_obj = Suit.query.get(suit)
+    db.session.delete(suit_obj)
     db.session.commit()
+    suit_changed(suit, 'rejected')
     flash('Suit rejected')
     return redirect(url_for('.admin'))
 
 
+def chunks(items, size=BULK_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def selected_suit_ids():
+    """
+    Ids of the suits ticked on the admin suits page, or of every suit paid
+    for and awaiting review if 'pending' was chosen
+    """
+
+    if request.form.get('selection') == 'pending':
+        return [
+            suit_id for suit_id, in db.session.query(Suit.id).filter(
+                Suit.confirmed.isnot(None),
+                Suit.accepted.is_(None))]
+
+    try:
+        return sorted({
+            int(suit_id) for suit_id in request.form.getlist('suit')})
+
+    except ValueError:
+        abort(400)
+
+
+def bulk_accept(suit_ids):
+    """
+    Accept suits not yet accepted and queue an email to each plaintiff,
+    using one UPDATE and one outbox INSERT per chunk of ids. Returns the ids
+    of the suits accepted.
+    """
+
+    now = datetime.datetime.utcnow()
+    plaintiff = aliased(User)
+    defendant = aliased(User)
+    accepted = []
+
+    with unit_of_work():
+
+        for chunk in chunks(suit_ids):
+            rows = db.session.query(
+                Suit.id, plaintiff.email, plaintiff.name, defendant.name
+            ).join(
+                plaintiff, Suit.plaintiff_id == plaintiff.id
+            ).outerjoin(
+                defendant, Suit.defendant_id == defendant.id
+            ).filter(
+                Suit.id.in_(chunk),
+                Suit.accepted.is_(None)
+            ).with_for_update(of=Suit).all()
+
+            ids = [row[0] for row in rows]
+
+            if not ids:
+                continue
+
+            Suit.query.filter(Suit.id.in_(ids)).update(
+                {Suit.accepted: now}, synchronize_session=False)
+
+            notify['accept'].queue_emails(
+                (email, {'plaintiff': name, 'defendant': defendant_name})
+                for _, email, name, defendant_name in rows)
+
+            accepted.extend(ids)
+
+    return accepted
+
+
+def bulk_reject(suit_ids):
+    """
+    Delete suits with one DELETE per chunk of ids, returning how many
+    """
+
+    rejected = 0
+
+    with unit_of_work():
+
+        for chunk in chunks(suit_ids):
+            rejected += Suit.query.filter(Suit.id.in_(chunk)).delete(
+                synchronize_session=False)
+
+    return rejected
+
+
+@main.route('/admin/suits/bulk', methods=['POST'])
+@login_required
+@roles_required('admin')
+@accept_suit_permission.require()
+def bulk_update_suits():
+    action = request.form.get('action')
+
+    if action not in ('accept', 'reject'):
+        abort(400)
+
+    max_age = current_app.config.get("ACCEPT_SUIT_MAX_AGE")
+    if action == 'accept' and not authenticated_within(max_age):
+        return force_authentication()
+
+    suit_ids = selected_suit_ids()
+
+    if action == 'accept':
+        changed = bulk_accept(suit_ids)
+        count = len(changed)
+        event = 'accepted'
+
+    else:
+        changed = suit_ids
+        count = bulk_reject(suit_ids)
+        event = 'rejected'
+
+    suits_changed(changed, event)
+
+    flash('{} {} suits'.format(event.capitalize(), count))
+    return redirect(url_for('.admin_suits'))
+
+
 @main.route('/admin/users')
 @login_required
 @roles_required('admin')
+@query_budget(4)
 def admin_users():
     auth_state = session.pop("auth_state", None)
     callback_state = session.pop('callback_state', None)
     if auth_state is None or auth_state != callback_state:
         return reauthenticate(url_for('.admin_users'))
 
-    users = User.query.all()
+    query = User.query.options(selectinload(User.roles))
+
+    prefix = request.args.get('q', '').strip()
+    if prefix:
+        query = query.filter(or_(
+            User.email.startswith(prefix, autoescape=True),
+            User.name.startswith(prefix, autoescape=True)))
+
+    try:
+        cursor = (int(request.args['after']),)
+
+    except KeyError:
+        cursor = None
+
+    except ValueError:
+        abort(400)
+
+    users = keyset_paginate(
+        query,
+        [User.id],
+        cursor=cursor,
+        per_page=current_app.config.get('ADMIN_PAGE_SIZE', 50))
+
     return render_template(
         'admin/users.html',
         users=users,
+        q=prefix,
+        next_cursor=users.next_cursor and users.next_cursor[0],
         can_make_admin=make_admin_permission.can())
 
 
@@ -376,8 +808,12 @@ def update_user(user):
                 user_datastore.remove_role_from_user(user, admin_role)
                 flash('Made {} not an admin'.format(user.name))
 
+    suit_ids = user_suit_ids(user)
     db.session.commit()
 
+    for suit_id in suit_ids:
+        forget_suit_status(suit_id)
+
     return redirect(url_for('.admin_users'))
 
 
@@ -387,6 +823,7 @@ def update_user(user):
 def delete_user(user):
     user_id = user
     user = user_datastore.get_user(user)
+    suit_ids = user_suit_ids(user)
 
     with make_admin_permission.require():
         user_datastore.delete_user(user)
@@ -394,4 +831,7 @@ def delete_user(user):
 
     db.session.commit()
 
+    for suit_id in suit_ids:
+        forget_suit_status(suit_id)
+
     return redirect(url_for('.admin_users'))
@@ -1,3 +1,5 @@
+import threading
+
 from flask import url_for
 from oic.oic import Client
 from oic.oic.message import RegistrationRequest
@@ -5,15 +7,21 @@ from oic.utils.authn.client import CLIENT_AUTHN_METHOD
 
 from app.oidc_client import views  # noqa
 from app.oidc_client.decorators import authenticate, logout  # noqa
+from app.oidc_client.discovery import ProviderDiscovery
 
 
 class OIDCClient(object):
 
-    def __init__(self, app=None):
+    def __init__(self, app=None, lazy=False):
         if app:
-            self.init_app(app)
+            self.init_app(app, lazy=lazy)
+
+    def init_app(self, app, lazy=False):
+        """
+        If `lazy`, provider discovery is put off until the client is first
+        used, rather than done while the app is created
+        """
 
-    def init_app(self, app):
         self._app = app
 
         if not app.extensions:
@@ -24,16 +32,51 @@ class OIDCClient(object):
         config = app.config.get('OIDC_CLIENT', {})
 
         client = Client(client_authn_method=CLIENT_AUTHN_METHOD)
-        client.provider_config(config['issuer'])
+
+        self.discovery = ProviderDiscovery(
+            client,
+            config['issuer'],
+            cache_dir=app.config.get('OIDC_DISCOVERY_CACHE_DIR'),
+            ttl=app.config.get('OIDC_DISCOVERY_TTL', 3600))
+        self._refresh_interval = app.config.get(
+            'OIDC_DISCOVERY_REFRESH_INTERVAL')
+        self._discovered = False
+        self._lock = threading.Lock()
 
         config['redirect_uris'] = [self._init_redirect_uri(app)]
 
         client.store_registration_info(RegistrationRequest(**config))
 
-        self.client = client
+        self._client = client
         self.client_registration_info = config
         self.logout_view = None
 
+        if not lazy:
+            self._discover()
+
+    @property
+    def client(self):
+
+        if not self._discovered:
+            self._discover()
+
+        # XXX started on first use, as uWSGI forks its workers after the app
+        # is created
+        if self._refresh_interval:
+            self.discovery.start(self._refresh_interval)
+
+        return self._client
+
+    def _discover(self):
+
+        with self._lock:
+
+            if self._discovered:
+                return
+
+            self.discovery.load()
+            self._discovered = True
+
     def _init_redirect_uri(self, app):
         app.add_url_rule('/oidc_callback', 'oidc_callback', views.callback)
 
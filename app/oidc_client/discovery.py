@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Cached OpenID provider metadata and signing keys
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from oic.oic.message import ProviderConfigurationResponse
+from oic.utils.keyio import KeyBundle
+import requests
+
+from lib.private_dir import make_private_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachedDocument(object):
+    """
+    A JSON document fetched over HTTP and cached on disk, where it is shared
+    by all worker processes, and revalidated with its ETag once older than
+    `ttl` seconds
+    """
+
+    def __init__(self, url, cache_dir, ttl, timeout=10):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.path = os.path.join(cache_dir, 'oidc-{}.json'.format(
+            hashlib.sha1(url.encode('utf-8')).hexdigest()))
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+
+        except (IOError, ValueError):
+            return None
+
+    def is_fresh(self, record):
+        return record and time.time() - record['fetched'] < self.ttl
+
+    def fetch(self, record=None):
+        """
+        Revalidate `record` against the server, returning the current record
+        and whether its body changed
+        """
+
+        headers = {}
+        if record and record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+
+        r = requests.get(self.url, headers=headers, timeout=self.timeout)
+
+        if r.status_code == 304 and record:
+            record = dict(record, fetched=time.time())
+            changed = False
+
+        else:
+            r.raise_for_status()
+            changed = record is None or r.text != record['body']
+            record = {
+                'body': r.text,
+                'etag': r.headers.get('ETag'),
+                'fetched': time.time()}
+
+        self.save(record)
+
+        return record, changed
+
+    def save(self, record):
+        # write then rename, so other processes never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+
+        os.replace(tmp_path, self.path)
+
+    def get(self):
+        """
+        The cached record, revalidated first if it is stale. A stale record
+        is still used if the provider cannot be reached.
+        """
+
+        record = self.load()
+
+        if record is None:
+            record, _ = self.fetch()
+
+        elif not self.is_fresh(record):
+
+            try:
+                record, _ = self.fetch(record)
+
+            except requests.RequestException:
+                logger.exception(
+                    'Revalidating %s failed, using the cached copy', self.url)
+
+        return record
+
+
+class ProviderDiscovery(object):
+    """
+    Keeps an OIDC client's provider metadata and keys up to date from an
+    on-disk cache, refreshed from the provider in a background thread
+    """
+
+    def __init__(self, client, issuer, cache_dir, ttl=3600):
+        self.client = client
+        self.issuer = issuer
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.config = CachedDocument(
+            '{}/.well-known/openid-configuration'.format(
+                issuer.rstrip('/')),
+            self.cache_dir,
+            ttl)
+        self.jwks = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        # XXX keys planted in the cache would be trusted
+        make_private_dir(cache_dir)
+
+    def load(self):
+        config = self.config.get()
+        pcr = self._apply_config(config)
+
+        if 'jwks_uri' in pcr:
+            self.jwks = CachedDocument(
+                pcr['jwks_uri'], self.cache_dir, self.ttl)
+            self._apply_jwks(self.jwks.get())
+
+        return self
+
+    def refresh(self):
+        """
+        Revalidate any stale documents, applying them if they changed
+        """
+
+        record = self.config.load()
+
+        if not self.config.is_fresh(record):
+            record, changed = self.config.fetch(record)
+
+            if changed:
+                logger.info('Provider metadata for %s changed', self.issuer)
+                self._apply_config(record)
+
+        if self.jwks is None:
+            return
+
+        record = self.jwks.load()
+
+        if not self.jwks.is_fresh(record):
+            record, changed = self.jwks.fetch(record)
+
+            if changed:
+                logger.info('Signing keys for %s rotated', self.issuer)
+                self._apply_jwks(record)
+
+    def start(self, interval):
+        """
+        Refresh every `interval` seconds in a daemon thread, unless this
+        process already started one. Forked workers, such as uWSGI's, don't
+        inherit their parent's thread, so each starts its own.
+        """
+
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+
+            if self._pid != os.getpid():
+                self._start(interval)
+                self._pid = os.getpid()
+
+    def _start(self, interval):
+
+        def run():
+            while True:
+                time.sleep(interval)
+
+                try:
+                    self.refresh()
+
+                except Exception:
+                    logger.exception(
+                        'Refreshing provider metadata for %s failed',
+                        self.issuer)
+
+        self._thread = threading.Thread(
+            target=run, name='oidc-discovery', daemon=True)
+        self._thread.start()
+
+    def _apply_config(self, record):
+        pcr = ProviderConfigurationResponse().from_json(record['body'])
+        self.client.handle_provider_config(pcr, self.issuer, keys=False)
+        return pcr
+
+    def _apply_jwks(self, record):
+        keys = json.loads(record['body'])['keys']
+        self.client.keyjar.issuer_keys[self.client.issuer] = [
+            KeyBundle(keys)]
@@ -53,11 +53,12 @@ def _get_tokens(code, state):
         'redirect_uri': client.registration_response['redirect_uris'][0],
     }
 
-    token_response = client.do_access_token_request(
-        state=state,
-        request_args=args,
-        authn_method=client.registration_response.get(
-            'token_endpoint_auth_method', 'client_secret_basic'))
+    with current_app.extensions['metrics'].external_timer('oidc', 'token'):
+        token_response = client.do_access_token_request(
+            state=state,
+            request_args=args,
+            authn_method=client.registration_response.get(
+                'token_endpoint_auth_method', 'client_secret_basic'))
 
     id_token = token_response['id_token']
     if id_token['nonce'] != session.pop('nonce'):
@@ -69,8 +70,13 @@ def _get_tokens(code, state):
 def _get_userinfo(id_token, state):
     client = current_app.extensions['oidc_client'].client
 
+    timer = current_app.extensions['metrics'].external_timer(
+        'oidc', 'userinfo', expected=MissingEndpoint)
+
     try:
-        userinfo = client.do_user_info_request(method='POST', state=state)
+        with timer:
+            userinfo = client.do_user_info_request(
+                method='POST', state=state)
 
     except MissingEndpoint:
         return None
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Compare request latency with log handlers run on the request thread and
+behind a queue, using the app's LOGGING config with its file handler
+pointed at a temporary file
+
+    python -m benchmarks.logging_latency --requests 2000 --lines 5
+"""
+
+import argparse
+import copy
+import logging
+import os
+import sys
+import statistics
+import tempfile
+import time
+
+from flask import Flask
+
+from app.config import LOGGING
+from lib.log_queue import configure_logging, stop_listeners
+
+
+class SlowFileHandler(logging.FileHandler):
+    """
+    File handler that waits before each write, like a busy disk or
+    network filesystem
+    """
+
+    def __init__(self, filename, delay_seconds=0.0, **kwargs):
+        super(SlowFileHandler, self).__init__(filename, **kwargs)
+        self.delay_seconds = delay_seconds
+
+    def emit(self, record):
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        super(SlowFileHandler, self).emit(record)
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--requests', type=int, default=2000)
+    parser.add_argument('-l', '--lines', type=int, default=5, help="""
+        Lines logged per request, the OIDC callback logs about five""".strip())
+    parser.add_argument('-d', '--write-delay', type=float, default=0.0,
+                        help='Seconds each write to the log file takes')
+    return parser.parse_args()
+
+
+def logging_config(filename, write_delay):
+    config = copy.deepcopy(LOGGING)
+
+    # XXX the app's logger exists by the second run
+    config['disable_existing_loggers'] = False
+
+    # XXX only the file handler, so the console isn't flooded
+    config['handlers'] = {'file': dict(
+        config['handlers']['file'],
+        filename=filename,
+        delay_seconds=write_delay,
+        level='INFO',
+        **{'class': 'benchmarks.logging_latency.SlowFileHandler'})}
+
+    for logger in [config['root']] + list(config['loggers'].values()):
+        logger['handlers'] = ['file']
+        logger['level'] = 'INFO'
+
+    return config
+
+
+def create_app(lines):
+    app = Flask('benchmark')
+
+    @app.route('/callback')
+    def callback():
+        for n in range(lines):
+            app.logger.info('Handling authentication callback, step %d', n)
+        return 'ok'
+
+    return app
+
+
+def measure(app, requests):
+    client = app.test_client()
+    timings = []
+
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get('/callback')
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    print('{:<8} mean {:.3f}ms  p50 {:.3f}ms  p99 {:.3f}ms'.format(
+        name,
+        statistics.mean(timings) * 1000,
+        timings[len(timings) // 2] * 1000,
+        timings[int(len(timings) * 0.99)] * 1000))
+
+
+def main():
+    args = get_args()
+    app = create_app(args.lines)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.log')
+
+        for name, queued in (('direct', False), ('queued', True)):
+            configure_logging(
+                logging_config(filename, args.write_delay), queued=queued)
+            results[name] = measure(app, args.requests)
+
+            start = time.perf_counter()
+            stop_listeners()
+            drained = time.perf_counter() - start
+
+            report(name, results[name])
+
+            if queued:
+                print('{:<8} {:.0f}ms to write out the queue'.format(
+                    '', drained * 1000))
+
+        logging.shutdown()
+
+    saved = statistics.mean(results['direct']) - statistics.mean(
+        results['queued'])
+
+    print('{} requests logging {} lines: {:.3f}ms saved per request'.format(
+        args.requests, args.lines, saved * 1000))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Send messages through the Notify client from many threads against a local
+stub, checking every message arrives intact and reporting throughput
+
+    python -m benchmarks.notify_concurrency --messages 5000 --threads 50
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import threading
+import time
+
+from benchmarks.stub_server import StubServer
+from lib.notify import Notification, Notify
+from lib.http_session import pooled_session
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--messages', type=int, default=5000)
+    parser.add_argument('-t', '--threads', type=int, default=50)
+    parser.add_argument('-p', '--pool-size', type=int, default=10)
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help="""
+        Seconds the stub waits before responding""".strip())
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    received = {}
+    lock = threading.Lock()
+
+    def handler(method, path, data):
+        with lock:
+            received.setdefault(data['to'], []).append(data)
+        return 201, {'id': data['to']}
+
+    with StubServer(handler, latency=args.latency) as server:
+        notify = Notify()
+        notify.base_url = server.url
+        notify.client_id = 'benchmark'
+        notify.secret = 'benchmark-secret-key-for-local-stub'
+        notify.session = pooled_session(args.pool_size)
+        sms = Notification(notify, 'benchmark-template')
+
+        def send(n):
+            sms.send_sms(recipient(n), n=n)
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(send, range(args.messages)))
+
+        elapsed = time.perf_counter() - start
+        connections = len(server.clients)
+
+    errors = check(received, args.messages)
+
+    print('{} messages from {} threads in {:.2f}s: {:.0f} msg/s'.format(
+        args.messages, args.threads, elapsed, args.messages / elapsed))
+    print('{} connections opened (pool size {})'.format(
+        connections, args.pool_size))
+
+    for error in errors[:10]:
+        print(error)
+
+    return 1 if errors else 0
+
+
+def recipient(n):
+    return '07{:09d}'.format(n)
+
+
+def check(received, count):
+    errors = []
+
+    for n in range(count):
+        messages = received.get(recipient(n), [])
+
+        if len(messages) != 1:
+            errors.append('{}: received {} times'.format(
+                recipient(n), len(messages)))
+
+        elif messages[0]['personalisation'] != {'n': n}:
+            errors.append('{}: wrong personalisation {}'.format(
+                recipient(n), messages[0]['personalisation']))
+
+    return errors
+
+
+if __name__ == '__main__':
+    sys.exit(main())
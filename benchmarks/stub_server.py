@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal threaded HTTP server for benchmarking API clients locally
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+import threading
+import time
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency=0):
+        """
+        Serve on a free local port, calling `handler(method, path, body)`
+        for every request, which returns `(status, json_response)`
+        """
+
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubRequestHandler)
+        self.handler = handler
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive, so connection reuse by clients can be observed
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        with self.server.lock:
+            self.server.clients.add(self.client_address)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status, response = self.server.handler(
+            self.command,
+            self.path,
+            json.loads(body.decode('utf-8')) if body else None)
+
+        payload = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Prebuilt, fingerprinted asset bundles Flask extension
+
+Bundles are compiled ahead of time by build_assets, which writes each one
+under a content-hashed filename alongside gzip (and brotli, if installed)
+variants, and records them in a manifest. At runtime asset URLs come
+straight from the manifest, so rendering a page never touches the
+filesystem, and the files are served with far-future cache headers.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+# preferred first
+ENCODINGS = (
+    ('br', '.br'),
+    ('gzip', '.gz'),
+)
+
+
+def fingerprint(data, length=12):
+    return hashlib.sha256(data).hexdigest()[:length]
+
+
+def compress(data):
+    variants = {'gzip': gzip.compress(data, compresslevel=9)}
+
+    if brotli:
+        variants['br'] = brotli.compress(data)
+
+    return variants
+
+
+def write_file(path, data):
+    tmp_path = '{}.tmp'.format(path)
+
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+
+    os.replace(tmp_path, path)
+
+
+def build_assets(env, output_dir):
+    """
+    Compile every bundle registered with the webassets environment into
+    output_dir and write manifest.json describing the results
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+
+    # XXX webassets has no public way to list bundles with their names
+    for name, bundle in sorted(env._named_bundles.items()):
+        hunk, = bundle.build(force=True, disable_cache=True)
+        data = hunk.data().encode('utf-8')
+
+        base, ext = os.path.splitext(os.path.basename(bundle.output))
+        filename = '{}.{}{}'.format(base, fingerprint(data), ext)
+        write_file(os.path.join(output_dir, filename), data)
+
+        variants = compress(data)
+        for encoding, suffix in ENCODINGS:
+            if encoding in variants:
+                write_file(
+                    os.path.join(output_dir, filename + suffix),
+                    variants[encoding])
+
+        manifest[name] = {
+            'path': filename,
+            'encodings': [
+                encoding for encoding, _ in ENCODINGS
+                if encoding in variants]}
+
+    write_file(
+        os.path.join(output_dir, 'manifest.json'),
+        json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    return manifest
+
+
+class AssetManifest(object):
+    """
+    Resolves bundle names to prebuilt asset URLs and serves the files
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.files = {}
+        self.output_dir = None
+        self.max_age = ONE_YEAR
+        self.env = None
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app, env=None):
+        self.env = env
+        self.output_dir = app.config.get(
+            'ASSETS_OUTPUT_DIR',
+            os.path.join(app.static_folder, 'dist'))
+        self.max_age = app.config.get('ASSETS_MAX_AGE', ONE_YEAR)
+        self.load()
+
+        app.add_url_rule(
+            app.config.get('ASSETS_URL_PATH', '/assets/<path:filename>'),
+            'prebuilt_asset',
+            self.serve)
+        app.add_template_global(self.asset_url)
+
+    def load(self):
+        path = os.path.join(self.output_dir, 'manifest.json')
+
+        try:
+            with open(path) as f:
+                self.manifest = json.load(f)
+
+        except FileNotFoundError:
+            self.manifest = {}
+
+        self.files = {
+            entry['path']: entry['encodings']
+            for entry in self.manifest.values()}
+
+    def asset_url(self, name):
+        """
+        URL of a bundle, falling back to building it with webassets when
+        there is no manifest, eg. during development
+        """
+
+        entry = self.manifest.get(name)
+
+        if entry:
+            return url_for('prebuilt_asset', filename=entry['path'])
+
+        if self.env is None:
+            raise KeyError(name)
+
+        return self.env[name].urls()[0]
+
+    def serve(self, filename):
+
+        # only files listed in the manifest, so nothing to stat for a 404
+        if filename not in self.files:
+            abort(404)
+
+        accepted = request.accept_encodings
+        encoding = next(
+            (e for e in self.files[filename] if accepted[e]), None)
+        suffix = dict(ENCODINGS).get(encoding, '')
+
+        response = send_from_directory(
+            self.output_dir, filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0],
+            cache_timeout=self.max_age)
+
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+        # filenames change with their content, so they can be cached forever
+        response.headers['Cache-Control'] = (
+            'public, max-age={}, immutable'.format(self.max_age))
+        response.headers['Vary'] = 'Accept-Encoding'
+
+        return response
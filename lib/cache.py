@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Read-through cache Flask extension
+
+Values are kept in a small in-process LRU and, if CACHE_REDIS_URL is set,
+in Redis shared by all workers. Deleting a value only removes it from this
+worker's LRU, so local entries expire after CACHE_LOCAL_TTL seconds, and an
+invalidation made by one worker is seen by the others within that time.
+"""
+
+from collections import OrderedDict
+import datetime
+import threading
+import time
+
+from flask.json.tag import JSONTag, TaggedJSONSerializer
+
+
+MISSING = object()
+
+
+class TagDateTime(JSONTag):
+    """
+    Naive datetimes to the microsecond, where the default tag uses HTTP
+    dates and loses them, so values read back from Redis compare equal to
+    the ones cached in process
+    """
+
+    __slots__ = ()
+    key = ' dt'
+    format = '%Y-%m-%dT%H:%M:%S.%f'
+
+    def check(self, value):
+        return isinstance(value, datetime.datetime)
+
+    def to_json(self, value):
+        return value.strftime(self.format)
+
+    def to_python(self, value):
+        return datetime.datetime.strptime(value, self.format)
+
+
+def make_serializer():
+    serializer = TaggedJSONSerializer()
+    serializer.register(TagDateTime, index=0)
+    return serializer
+
+
+class LRUCache(object):
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value, expires = self.entries.get(key, (MISSING, None))
+
+            if value is MISSING:
+                return MISSING
+
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisBackend(object):
+
+    def __init__(self, url, ttl, prefix='cache:'):
+        # optional dependency, only needed for a shared cache
+        import redis
+
+        self.client = redis.StrictRedis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.serializer = make_serializer()
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+
+        if data is None:
+            return MISSING
+
+        return self.serializer.loads(data.decode('utf-8'))
+
+    def set(self, key, value):
+        self.client.set(
+            self.prefix + key, self.serializer.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class Cache(object):
+
+    def __init__(self, app=None):
+        self.local = LRUCache()
+        self.shared = None
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        redis_url = app.config.get('CACHE_REDIS_URL')
+
+        if redis_url:
+            self.shared = RedisBackend(
+                redis_url, app.config.get('CACHE_TTL', 300))
+
+        self.local = LRUCache(
+            app.config.get('CACHE_SIZE', 1024),
+            app.config.get('CACHE_LOCAL_TTL', 5))
+
+    def get(self, key):
+        value = self.local.get(key)
+
+        if value is MISSING and self.shared:
+            value = self.shared.get(key)
+
+            if value is not MISSING:
+                self.local.set(key, value)
+
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+
+        if self.shared:
+            self.shared.set(key, value)
+
+    def get_or_set(self, key, load):
+        """
+        Cached value for key, calling load() to fill the cache on a miss.
+        None is not cached, so missing things can appear later.
+        """
+
+        value = self.get(key)
+
+        if value is MISSING:
+            value = load()
+
+            if value is not None:
+                self.set(key, value)
+
+        return value
+
+    def delete(self, key):
+        self.local.delete(key)
+
+        if self.shared:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+
+        if self.shared:
+            self.shared.clear()
@@ -3,22 +3,42 @@
 Manager command for installing GOV.UK assets
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import glob
+import hashlib
+import json
 import os
 import shutil
 import subprocess
-from tempfile import TemporaryDirectory
-from urllib.request import urlretrieve
+from tempfile import TemporaryDirectory, mkdtemp
+import threading
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
 import zipfile
 
 
-def install_govuk_assets(app_dir, logger=None):
-    for package in ('frontend_toolkit', 'elements', 'template'):
-        install(package, app_dir, logger)
+PACKAGES = ('frontend_toolkit', 'elements', 'template')
 
+DEFAULT_CACHE_DIR = os.environ.get(
+    'GOVUK_ASSETS_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'govuk_assets'))
 
-def install(package, app_dir, logger=None):
+index_lock = threading.Lock()
+
+
+def install_govuk_assets(app_dir, logger=None, cache_dir=DEFAULT_CACHE_DIR):
+    with ThreadPoolExecutor(max_workers=len(PACKAGES)) as executor:
+        installs = [
+            executor.submit(install, package, app_dir, logger, cache_dir)
+            for package in PACKAGES]
+
+        # re-raise the first failure, if any
+        for future in installs:
+            future.result()
+
+
+def install(package, app_dir, logger=None, cache_dir=DEFAULT_CACHE_DIR):
     meta = package_metadata[package]
 
     def log(msg):
@@ -31,10 +51,14 @@ def install(package, app_dir, logger=None):
 
     remove_package(meta, app_dir)
 
-    with download_and_unzip(meta['url']) as unzip_dir:
-        meta['install'](unzip_dir, app_dir, meta['dirs'])
+    archive = fetch_archive(meta['url'], cache_dir)
+    build_dir = os.path.join(
+        cache_dir, 'build', '{}-{}'.format(package, archive_hash(archive)))
 
-    log('Done')
+    with unzip(archive) as unzip_dir:
+        meta['install'](unzip_dir, app_dir, meta['dirs'], build_dir)
+
+    log('Done installing {}'.format(package))
 
 
 def is_installed(package, app_dir):
@@ -44,7 +68,7 @@ def is_installed(package, app_dir):
 
 
 def remove_govuk_assets(app_dir):
-    for package in ('frontend_toolkit', 'elements', 'template'):
+    for package in PACKAGES:
         remove_package(package_metadata[package], app_dir)
 
 
@@ -53,38 +77,55 @@ def remove_package(package, app_dir):
         rmdir(path.format(app_dir))
 
 
-def install_frontend_toolkit(unzip_dir, app_dir, dirs):
+def install_frontend_toolkit(unzip_dir, app_dir, dirs, build_dir):
     for path in ('images', 'javascripts', 'stylesheets'):
         move_dir(
             '{}/govuk_frontend_toolkit-master/{}'.format(unzip_dir, path),
             to=dirs['dest_dir'].format(app_dir))
 
 
-def install_elements(unzip_dir, app_dir, dirs):
+def install_elements(unzip_dir, app_dir, dirs, build_dir):
     move_dir(
         '{}/govuk_elements-master/public'.format(unzip_dir),
         to=dirs['dest_dir'].format(app_dir))
 
 
-def install_template(unzip_dir, app_dir, dirs):
-    master_dir = '{}/govuk_template-master'.format(unzip_dir)
+def install_template(unzip_dir, app_dir, dirs, build_dir):
 
-    with pushd(master_dir):
-        compile_template()
+    # compiling is slow, so reuse the output for the same archive
+    if not os.path.isdir(build_dir):
+        master_dir = '{}/govuk_template-master'.format(unzip_dir)
+        compile_template(master_dir)
 
-    move_dir(
-        '{}/pkg/jinja_govuk_template*/assets'.format(master_dir),
+        os.makedirs(os.path.dirname(build_dir), exist_ok=True)
+        tmp_dir = mkdtemp(dir=os.path.dirname(build_dir))
+
+        move_dir('{}/pkg/jinja_govuk_template*/assets'.format(master_dir),
+                 to=tmp_dir)
+        move_dir('{}/pkg/jinja_govuk_template*/views'.format(master_dir),
+                 to=tmp_dir)
+
+        try:
+            os.rename(tmp_dir, build_dir)
+
+        # XXX another install finished the same build first
+        except OSError:
+            rmdir(tmp_dir)
+
+    copy_dir(
+        '{}/assets'.format(build_dir),
         to=dirs['dest_assets'].format(app_dir))
 
-    move_dir(
-        '{}/pkg/jinja_govuk_template*/views'.format(master_dir),
+    copy_dir(
+        '{}/views'.format(build_dir),
         to=dirs['dest_views'].format(app_dir))
 
 
-def compile_template():
-    os.remove('.ruby-version')
-    subprocess.call(['bundle', 'install'])
-    subprocess.call(['bundle', 'exec', 'rake', 'build:jinja'])
+def compile_template(master_dir):
+    os.remove(os.path.join(master_dir, '.ruby-version'))
+    subprocess.check_call(['bundle', 'install'], cwd=master_dir)
+    subprocess.check_call(
+        ['bundle', 'exec', 'rake', 'build:jinja'], cwd=master_dir)
 
 
 package_metadata = {
@@ -116,26 +157,93 @@ package_metadata = {
 }
 
 
-@contextlib.contextmanager
-def download_and_unzip(url):
-    with TemporaryDirectory() as download_dir:
-        dest_zip = '{}/package.zip'.format(download_dir)
-        unzip_dir = '{}/unzipped'.format(download_dir)
+def read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'index.json')) as f:
+            return json.load(f)
+
+    except FileNotFoundError:
+        return {}
+
+
+def update_index(cache_dir, url, entry):
+    with index_lock:
+        index = read_index(cache_dir)
+        index[url] = entry
+        write_file(
+            os.path.join(cache_dir, 'index.json'),
+            json.dumps(index, indent=2, sort_keys=True).encode('utf-8'))
+
+
+def archive_path(cache_dir, sha256):
+    return os.path.join(cache_dir, 'archives', '{}.zip'.format(sha256))
+
+
+def archive_hash(path):
+    return os.path.splitext(os.path.basename(path))[0]
 
-        urlretrieve(url, dest_zip)
 
-        with zipfile.ZipFile(dest_zip) as zf:
+def fetch_archive(url, cache_dir):
+    """
+    Path to a cached copy of the archive at url, stored under the hash of
+    its content. Revalidated with the ETag of the cached copy, which is
+    used as is when the server can't be reached.
+    """
+
+    entry = read_index(cache_dir).get(url, {})
+    cached = None
+    headers = {}
+
+    if entry and os.path.exists(archive_path(cache_dir, entry['sha256'])):
+        cached = archive_path(cache_dir, entry['sha256'])
+
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+
+    try:
+        with urlopen(Request(url, headers=headers)) as response:
+            data = response.read()
+            etag = response.headers.get('ETag')
+
+    except HTTPError as e:
+        if e.code == 304 and cached:
+            return cached
+        raise
+
+    except URLError:
+        if cached:
+            return cached
+        raise
+
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = archive_path(cache_dir, sha256)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, data)
+
+    update_index(cache_dir, url, {'sha256': sha256, 'etag': etag})
+
+    return path
+
+
+@contextlib.contextmanager
+def unzip(archive):
+    with TemporaryDirectory() as unzip_dir:
+
+        with zipfile.ZipFile(archive) as zf:
             zf.extractall(unzip_dir)
 
         yield unzip_dir
 
 
-@contextlib.contextmanager
-def pushd(path):
-    old_cwd = os.getcwd()
-    os.chdir(path)
-    yield
-    os.chdir(old_cwd)
+def write_file(path, data):
+    tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+
+    os.replace(tmp_path, path)
 
 
 def move_dir(src, to):
@@ -147,6 +255,12 @@ def move_dir(src, to):
         shutil.move(f, to)
 
 
+def copy_dir(src, to):
+    rmdir(os.path.join(to, os.path.basename(src)))
+    os.makedirs(to, exist_ok=True)
+    shutil.copytree(src, os.path.join(to, os.path.basename(src)))
+
+
 def rmdir(path):
     if os.path.isdir(path):
         shutil.rmtree(path)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP sessions for API clients
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_POOL_SIZE = 10
+
+
+def pooled_session(pool_size=DEFAULT_POOL_SIZE, max_retries=0):
+    """
+    A requests session keeping up to `pool_size` keep-alive connections per
+    host, safe to share between threads
+    """
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=max_retries)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
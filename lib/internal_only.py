@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Views only served to clients on INTERNAL_NETWORKS, such as metrics that
+are scraped without logging in but must not be public
+"""
+
+import functools
+import ipaddress
+
+from flask import abort, current_app, request
+
+
+DEFAULT_NETWORKS = ('127.0.0.0/8', '::1/128')
+
+
+def is_internal(address):
+    networks = current_app.config.get('INTERNAL_NETWORKS', DEFAULT_NETWORKS)
+
+    try:
+        address = ipaddress.ip_address(address)
+
+    except ValueError:
+        return False
+
+    return any(address in ipaddress.ip_network(network)
+               for network in networks)
+
+
+def internal_only(view):
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+
+        if not is_internal(request.remote_addr):
+            abort(403)
+
+        return view(*args, **kwargs)
+
+    return wrapper
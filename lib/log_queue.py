@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Logging off the request thread
+
+configure_logging() applies a dictConfig, then moves each configured
+logger's handlers behind a QueueHandler. Request threads only put records
+on a queue; a listener thread formats them and does the writes.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import logging.config
+import os
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import threading
+
+
+# attributes every LogRecord has, anything else was passed in extra=
+RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message'}
+
+_handlers = []
+_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, including any extra= fields
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(
+                record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS and key not in entry:
+                entry[key] = value
+
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Only merges the message with its arguments before queueing, leaving
+    formatting to `targets` on a listener thread.
+
+    The listener is started with a fresh queue by the first record each
+    process logs. So forked workers, such as uWSGI's, write their own
+    records, and never records their parent queued before the fork.
+    """
+
+    def __init__(self, targets):
+        super(DeferredQueueHandler, self).__init__(None)
+        self.targets = targets
+        self.listener = None
+        self.pid = None
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            self.start()
+
+        super(DeferredQueueHandler, self).enqueue(record)
+
+    def start(self):
+        self.acquire()
+
+        try:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.listener = QueueListener(
+                    self.queue, *self.targets, respect_handler_level=True)
+                self.listener.start()
+                self.pid = os.getpid()
+
+        finally:
+            self.release()
+
+    def stop(self):
+        """
+        Write out queued records and stop the listener thread, if this
+        process started it. The next record starts another.
+        """
+
+        self.acquire()
+
+        try:
+            if self.pid == os.getpid():
+                self.listener.stop()
+
+            self.listener = None
+            self.pid = None
+
+        finally:
+            self.release()
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def queue_handlers(names):
+    """
+    Move the handlers of the named loggers behind queues, one listener
+    thread per distinct set of handlers. '' is the root logger. Returns
+    the queue handlers installed.
+    """
+
+    queued = {}
+
+    for name in names:
+        logger = logging.getLogger(name)
+        targets = tuple(logger.handlers)
+
+        if not targets:
+            continue
+
+        if targets not in queued:
+            queued[targets] = DeferredQueueHandler(targets)
+
+        logger.handlers = [queued[targets]]
+
+    return list(queued.values())
+
+
+def stop_listeners():
+    """
+    Write out queued records and stop the listener threads
+    """
+
+    with _lock:
+        while _handlers:
+            _handlers.pop().stop()
+
+
+def configure_logging(config, queued=True):
+
+    # XXX flush records queued for the old handlers before dictConfig
+    # closes them
+    stop_listeners()
+
+    logging.config.dictConfig(config)
+
+    if queued and config:
+        with _lock:
+            _handlers.extend(
+                queue_handlers([''] + list(config.get('loggers', {}))))
+
+
+atexit.register(stop_listeners)
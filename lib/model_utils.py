@@ -3,7 +3,11 @@
 Util mixins for models
 """
 
+import contextlib
+
 from flask import abort
+from sqlalchemy import and_, inspect, literal_column, or_
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
 from app.extensions import db
@@ -13,17 +17,97 @@ class GetOrCreateMixin(object):
 
     @classmethod
     def get_or_create(cls, **kwargs):
-        try:
-            return cls.query.filter_by(**kwargs).one(), False
+        key = _unique_key(cls, kwargs)
 
-        except NoResultFound:
-            obj = cls(**kwargs)
-            db.session.add(obj)
-            db.session.commit()
-            return obj, True
+        if key is not None and db.engine.name in UPSERT_STATEMENTS:
+            return cls._upsert(key, **kwargs)
 
-        except MultipleResultsFound:
-            raise
+        # non-unique lookups (eg. brothers by name) take the oldest match
+        obj = cls.query.filter_by(**kwargs).order_by(
+            *cls.__table__.primary_key.columns).first()
+
+        if obj is not None:
+            return obj, False
+
+        obj = cls(**kwargs)
+        db.session.add(obj)
+        commit()
+        return obj, True
+
+    @classmethod
+    def _upsert(cls, key, **kwargs):
+        """
+        Insert a row unless one with the same unique `key` exists, in a
+        single statement, so concurrent callers cannot race between the
+        lookup and the insert
+        """
+
+        upsert = UPSERT_STATEMENTS[db.engine.name]
+        result = db.session.execute(upsert(cls.__table__, key, kwargs))
+
+        # XXX Postgres returns the row, inserted or not, in the same round
+        # trip. SQLite is in process, so querying for it costs little.
+        if result.returns_rows:
+            row = result.first()
+            commit()
+            return _load_row(cls, row), row.inserted
+
+        created = result.rowcount == 1
+
+        commit()
+
+        return cls.query.filter_by(**{key: kwargs[key]}).one(), created
+
+
+def _unique_key(cls, kwargs):
+    columns = cls.__table__.columns
+
+    if not set(kwargs).issubset(columns.keys()):
+        return None
+
+    for column in columns:
+        if column.name in kwargs and (column.unique or column.primary_key):
+            return column.name
+
+
+def _load_row(cls, row):
+    """
+    Add an instance of `cls` holding the values in `row` to the session,
+    as if it had been loaded by a query
+    """
+
+    mapper = inspect(cls)
+    obj = mapper.class_manager.new_instance()
+
+    for prop in mapper.column_attrs:
+        setattr(obj, prop.key, row[prop.columns[0].name])
+
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+
+def _postgresql_upsert(table, key, values):
+    from sqlalchemy.dialects.postgresql import insert
+    statement = insert(table).values(**values)
+
+    # XXX unlike DO NOTHING, a no-op update returns the existing row.
+    # xmax is only 0 on a row this statement inserted.
+    return statement.on_conflict_do_update(
+        index_elements=[key],
+        set_={key: statement.excluded[key]}
+    ).returning(
+        *(list(table.columns) + [
+            literal_column('xmax = 0').label('inserted')]))
+
+
+def _sqlite_upsert(table, key, values):
+    return table.insert().prefix_with('OR IGNORE').values(**values)
+
+
+UPSERT_STATEMENTS = {
+    'postgresql': _postgresql_upsert,
+    'sqlite': _sqlite_upsert,
+}
 
 
 class GetOr404Mixin(object):
@@ -50,4 +134,99 @@ class UpdateMixin(object):
                 setattr(self, key, val)
 
         db.session.add(self)
+        commit()
+
+
+@contextlib.contextmanager
+def unit_of_work():
+    """
+    Defer the commits made by the model mixins until the end of the block,
+    so all the changes made inside it are committed in one transaction, or
+    rolled back together if it raises. Blocks can be nested; only the
+    outermost one commits.
+    """
+
+    info = db.session.info
+    info['unit_of_work_depth'] = info.get('unit_of_work_depth', 0) + 1
+
+    try:
+        yield
+
+    except Exception:
+        info['unit_of_work_depth'] -= 1
+
+        if not info['unit_of_work_depth']:
+            db.session.rollback()
+
+        raise
+
+    info['unit_of_work_depth'] -= 1
+
+    if not info['unit_of_work_depth']:
         db.session.commit()
+
+
+def commit():
+    """
+    Commit the session, or inside a unit_of_work just flush it, so that
+    primary keys are assigned and constraint violations surface early
+    """
+
+    if db.session.info.get('unit_of_work_depth'):
+        db.session.flush()
+
+    else:
+        db.session.commit()
+
+
+class Page(object):
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=50):
+    """
+    Return a page of `query` ordered by `columns` descending, starting after
+    `cursor` (a tuple of column values taken from the last row of the
+    previous page).
+
+    Unlike OFFSET, the cost of fetching a page does not grow with its
+    position, as long as there is an index matching `columns`.
+    """
+
+    if cursor is not None:
+        query = query.filter(_keyset_before(columns, cursor))
+
+    query = query.order_by(*[col.desc() for col in columns])
+
+    # fetch one extra row to find out if there is a next page
+    items = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = tuple(getattr(last, col.key) for col in columns)
+
+    return Page(items, next_cursor)
+
+
+def _keyset_before(columns, cursor):
+    # (a, b) < (x, y)  =>  a < x OR (a = x AND b < y)
+    col, val = columns[0], cursor[0]
+
+    if len(columns) == 1:
+        return col < val
+
+    return or_(
+        col < val,
+        and_(col == val, _keyset_before(columns[1:], cursor[1:])))
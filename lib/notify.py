@@ -3,38 +3,132 @@
 GOV.UK Notify client Flask extension
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+from urllib.parse import urljoin
+
 from notifications_python_client import NotificationsAPIClient
+from notifications_python_client.authentication import create_jwt_token
+from notifications_python_client.errors import HTTPError
+import requests
+
+from lib.http_session import DEFAULT_POOL_SIZE, pooled_session
+
+
+class OutboxMixin(object):
+    """
+    Bookkeeping for notifications queued in the database and sent later by
+    a worker, see Notify.dispatch
+    """
+
+    max_attempts = 8
+    backoff_base = 30
+    backoff_max = 3600
+
+    @property
+    def data(self):
+        return json.loads(self.payload)
+
+    def mark_sent(self):
+        self.sent = datetime.datetime.utcnow()
+        self.error = None
+
+    def mark_failed(self, error):
+        self.attempts = (self.attempts or 0) + 1
+        self.error = str(error)[:255]
+
+        status_code = getattr(error, 'status_code', None)
+        permanent = status_code and 400 <= status_code < 500 and \
+            status_code != 429
+
+        if permanent or self.attempts >= self.max_attempts:
+            self.failed = True
+            return
+
+        delay = min(
+            self.backoff_base * 2 ** (self.attempts - 1),
+            self.backoff_max)
+        self.next_attempt = datetime.datetime.utcnow() + \
+            datetime.timedelta(seconds=delay)
 
 
 class Notification(object):
 
     def __init__(self, client, template_id):
         self.client = client
-        self.data = {'template': template_id}
+        self.template_id = template_id
+
+    def payload(self, recipient, personalisation=None):
+        """
+        Request body for one message, built fresh for every call so that
+        concurrent sends never share state
+        """
+
+        data = {'template': self.template_id, 'to': recipient}
+
+        if personalisation:
+            data['personalisation'] = dict(personalisation)
+
+        return data
 
     def _send(self, endpoint, recipient, personalisation):
 
         if self.client.disabled:
             return
 
-        self.data['to'] = recipient
-
-        if personalisation:
-            self.data['personalisation'] = personalisation
-
         try:
-            return self.client.post(endpoint, data=self.data)
+            return self.client.post(
+                endpoint, data=self.payload(recipient, personalisation))
 
         except Exception as e:
             print("POST {}{} failed".format(self.client.base_url, endpoint))
             raise e
 
+    def _queue(self, endpoint, recipient, personalisation):
+
+        if self.client.disabled:
+            return
+
+        return self.client._outbox_class.enqueue(
+            endpoint, self.payload(recipient, personalisation))
+
+    def _queue_many(self, endpoint, messages):
+
+        if self.client.disabled:
+            return 0
+
+        return self.client._outbox_class.enqueue_many(endpoint, [
+            self.payload(recipient, personalisation)
+            for recipient, personalisation in messages])
+
     def send_sms(self, recipient, **personalisation):
         return self._send('/notifications/sms', recipient, personalisation)
 
     def send_email(self, recipient, **personalisation):
         return self._send('/notifications/email', recipient, personalisation)
 
+    def queue_sms(self, recipient, **personalisation):
+        """
+        Add an SMS to the outbox, to be sent by the notification worker once
+        the current transaction is committed
+        """
+        return self._queue('/notifications/sms', recipient, personalisation)
+
+    def queue_email(self, recipient, **personalisation):
+        """
+        Add an email to the outbox, to be sent by the notification worker once
+        the current transaction is committed
+        """
+        return self._queue('/notifications/email', recipient, personalisation)
+
+    def queue_emails(self, messages):
+        """
+        Add an email for each (recipient, personalisation) pair to the outbox
+        in one insert, returning how many were queued
+        """
+        return self._queue_many('/notifications/email', messages)
+
 
 class Notify(NotificationsAPIClient):
 
@@ -44,6 +138,9 @@ class Notify(NotificationsAPIClient):
         self.secret = None
         self.disabled = False
         self.notifications = {}
+        self._outbox_class = None
+        self.timeout = None
+        self.session = pooled_session()
 
         if app:
             self.init_app(app)
@@ -56,6 +153,9 @@ class Notify(NotificationsAPIClient):
         self.client_id = config.get('client_id')
         self.secret = config.get('secret')
         self.disabled = config.get('disabled', False)
+        self.timeout = config.get('timeout')
+        self.session = pooled_session(
+            config.get('pool_size', DEFAULT_POOL_SIZE))
 
         if self.disabled:
             return
@@ -69,3 +169,66 @@ class Notify(NotificationsAPIClient):
 
     def __getitem__(self, key):
         return self.notifications[key]
+
+    def request(self, method, url, data=None, params=None):
+        """
+        Send an API request over the shared keep-alive connection pool
+        """
+
+        headers = {
+            'Content-type': 'application/json',
+            'Authorization': 'Bearer {}'.format(
+                create_jwt_token(self.secret, self.client_id)),
+        }
+
+        try:
+            response = self.session.request(
+                method,
+                urljoin(self.base_url, url),
+                headers=headers,
+                data=json.dumps(data) if data is not None else None,
+                params=params,
+                timeout=self.timeout)
+            response.raise_for_status()
+
+        except requests.RequestException as e:
+            raise HTTPError.create(e)
+
+        if response.status_code == 204:
+            return None
+
+        return response.json()
+
+    def outbox_class(self, cls):
+        self._outbox_class = cls
+        return cls
+
+    def dispatch(self, messages, max_workers=10):
+        """
+        Send queued messages concurrently, marking each as sent or failed
+        """
+
+        outgoing = [(message.endpoint, message.data) for message in messages]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            errors = list(executor.map(self._deliver, outgoing))
+
+        for message, error in zip(messages, errors):
+
+            if error is None:
+                message.mark_sent()
+
+            else:
+                message.mark_failed(error)
+
+        return errors.count(None)
+
+    def _deliver(self, request):
+        endpoint, data = request
+
+        try:
+            self.post(endpoint, data=data)
+
+        except Exception as e:
+            print("POST {}{} failed".format(self.base_url, endpoint))
+            return e
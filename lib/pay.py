@@ -1,14 +1,23 @@
+import contextlib
 import uuid
 
 from dateutil.parser import parse as parse_date
 import requests
 from requests.auth import AuthBase
+from requests.packages.urllib3.util.retry import Retry
+
+from lib.http_session import DEFAULT_POOL_SIZE, pooled_session
 
 
 def payment_reference():
     return str(uuid.uuid4())
 
 
+@contextlib.contextmanager
+def untimed(endpoint):
+    yield lambda: None
+
+
 class PaymentMixin(object):
 
     def update_from_json(self, json):
@@ -62,6 +71,12 @@ class Pay(object):
     def __init__(self, app=None):
         self.base_url = None
         self.api_key = None
+        self.disabled = False
+        self.timeout = (3.05, 10)
+        self.create_attempts = 3
+        self.session = pooled_session()
+        # like Metrics.external_timer, see app.factory.init_metrics
+        self.timer = untimed
         self._payment_class = None
 
         if app:
@@ -73,6 +88,21 @@ class Pay(object):
         self.base_url = config.get('base_url')
         self.api_key = config.get('api_key')
         self.disabled = config.get('disabled')
+        self.timeout = (
+            config.get('connect_timeout', 3.05),
+            config.get('read_timeout', 10))
+        self.create_attempts = config.get('retries', 2) + 1
+
+        # GETs are idempotent so are retried by the connection pool, POSTs
+        # are retried by create_payment, which knows how to check for a
+        # payment that was created before the connection failed
+        self.session = pooled_session(
+            config.get('pool_size', DEFAULT_POOL_SIZE),
+            max_retries=Retry(
+                total=config.get('retries', 2),
+                backoff_factor=0.1,
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False))
 
         if self.disabled:
             return
@@ -89,6 +119,22 @@ class Pay(object):
         self._payment_class = cls
         return cls
 
+    def _request(self, endpoint, method, url, **kwargs):
+
+        with self.timer(endpoint) as failed:
+            response = self.session.request(
+                method,
+                url,
+                auth=TokenAuth(self.api_key),
+                headers={'Accept': 'application/json'},
+                timeout=self.timeout,
+                **kwargs)
+
+            if response.status_code >= 500:
+                failed()
+
+        return response
+
     def create_payment(self, amount, desc, return_url, ref=None):
 
         if ref is None:
@@ -97,37 +143,71 @@ class Pay(object):
         if self.disabled:
             raise PaymentError('Pay module is disabled')
 
-        r = requests.post(
-            '{}/v1/payments'.format(self.base_url),
-            auth=TokenAuth(self.api_key),
-            headers={'Accept': 'application/json'},
-            json={
-                'amount': amount,
-                'reference': ref,
-                'description': desc,
-                'return_url': return_url})
-
-        if r.status_code in (400, 422, 500):
-            raise PaymentCreationError(r)
+        json = self._create({
+            'amount': amount,
+            'reference': ref,
+            'description': desc,
+            'return_url': return_url})
 
         payment = self._payment_class(
             reference=ref,
             amount=amount,
             description=desc)
-        payment.update_from_json(r.json())
+        payment.update_from_json(json)
         payment.save()
 
         return payment
 
-    def update_status(self, payment):
+    def _create(self, data):
 
-        if self.disabled:
-            raise PaymentError('Pay module is disabled')
+        for attempt in range(1, self.create_attempts + 1):
+
+            try:
+                r = self._request(
+                    'create_payment',
+                    'POST',
+                    '{}/v1/payments'.format(self.base_url),
+                    json=data)
+
+            except (requests.ConnectionError, requests.Timeout):
+
+                if attempt == self.create_attempts:
+                    raise
+
+                # the payment may have been created before the connection
+                # failed, in which case retrying would create a duplicate
+                json = self._find_payment(data['reference'])
+
+                if json:
+                    return json
 
-        r = requests.get(
-            payment.url,
-            auth=TokenAuth(self.api_key),
-            headers={'Accept': 'application/json'})
+                continue
+
+            if r.status_code in (400, 422, 500):
+                raise PaymentCreationError(r)
+
+            return r.json()
+
+    def _find_payment(self, ref):
+        r = self._request(
+            'search_payments',
+            'GET',
+            '{}/v1/payments'.format(self.base_url),
+            params={'reference': ref})
+
+        if r.status_code != 200:
+            return None
+
+        results = r.json().get('results', [])
+
+        if not results:
+            return None
+
+        # search results omit the next_url link, so fetch the full payment
+        return self._get_payment(results[0]['_links']['self']['href'])
+
+    def _get_payment(self, url):
+        r = self._request('get_payment', 'GET', url)
 
         if r.status_code == 401:
             raise PayAPIAuthFailed()
@@ -138,10 +218,23 @@ class Pay(object):
         if r.status_code == 500:
             raise PaymentError(r.json()['description'])
 
-        json = r.json()
+        return r.json()
+
+    def fetch_state(self, payment_url):
+        """
+        Current state of a payment, as reported by GOV.UK Pay
+        """
+
+        if self.disabled:
+            raise PaymentError('Pay module is disabled')
+
+        return self._get_payment(payment_url)['state']
+
+    def update_status(self, payment):
+        state = self.fetch_state(payment.url)
         payment.update(
-            status=json['state']['status'],
-            finished=json['state']['finished'],
-            status_msg=json['state'].get('message', ''))
+            status=state['status'],
+            finished=state['finished'],
+            status_msg=state.get('message', ''))
 
         return payment
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Directories only the current user can use
+"""
+
+import os
+import stat
+
+
+class InsecureDirectory(Exception):
+    pass
+
+
+def make_private_dir(path):
+    """
+    Create `path` with mode 0700, or check an existing one is a directory
+    owned by this user with no access for anyone else. Files other users
+    could plant or read there would otherwise be trusted, so raises
+    InsecureDirectory if not.
+    """
+
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+    info = os.lstat(path)
+
+    if not stat.S_ISDIR(info.st_mode):
+        raise InsecureDirectory('{} is not a directory'.format(path))
+
+    if info.st_uid != os.getuid():
+        raise InsecureDirectory('{} is owned by another user'.format(path))
+
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        raise InsecureDirectory(
+            '{} is open to other users, chmod it to 700'.format(path))
+
+    return path
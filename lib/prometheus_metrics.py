@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics Flask extension
+
+Records request latency per endpoint, outbound HTTP call latency per
+service, database connections in use and error counts, and serves them at
+METRICS_URL in the Prometheus text format.
+
+Under uWSGI or any other multi-process server, set PROMETHEUS_MULTIPROC_DIR
+to an empty directory before the app is imported. Each process then writes
+its figures there and the endpoint reports the total over all processes.
+"""
+
+import atexit
+import contextlib
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from lib.internal_only import internal_only
+
+
+def multiprocess_dir():
+    return (
+        os.environ.get('PROMETHEUS_MULTIPROC_DIR') or
+        os.environ.get('prometheus_multiproc_dir'))
+
+
+def mark_process_dead():
+    # XXX the pid of the process exiting, not the one that registered this
+    multiprocess.mark_process_dead(os.getpid())
+
+
+def at_worker_exit(func):
+    """
+    Call func as each worker process exits, with uWSGI's hook if running
+    under uWSGI, whose workers may exit without running atexit handlers
+    """
+
+    try:
+        import uwsgi
+
+    except ImportError:
+        atexit.register(func)
+        return
+
+    previous = getattr(uwsgi, 'atexit', None)
+
+    def run():
+        func()
+
+        if previous:
+            previous()
+
+    uwsgi.atexit = run
+
+
+class Metrics(object):
+
+    def __init__(self, app=None):
+        self.registry = CollectorRegistry()
+
+        self.request_latency = Histogram(
+            'http_request_duration_seconds',
+            'Time spent handling requests',
+            ['endpoint', 'method'],
+            registry=self.registry)
+        self.requests = Counter(
+            'http_requests_total',
+            'Responses sent, by status code',
+            ['endpoint', 'method', 'status'],
+            registry=self.registry)
+        self.request_exceptions = Counter(
+            'http_request_exceptions_total',
+            'Requests ended by an unhandled exception',
+            ['endpoint'],
+            registry=self.registry)
+        self.external_latency = Histogram(
+            'external_request_duration_seconds',
+            'Time spent waiting on other services',
+            ['service', 'operation'],
+            registry=self.registry)
+        self.external_errors = Counter(
+            'external_request_errors_total',
+            'Calls to other services that failed or returned a server error',
+            ['service', 'operation'],
+            registry=self.registry)
+        self.db_connections = Gauge(
+            'db_pool_connections_in_use',
+            'Database connections checked out of the pool',
+            registry=self.registry,
+            multiprocess_mode='livesum')
+
+        # labels() is the slowest part of recording, so reuse its results
+        self._request_metrics = {}
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+
+        if not event.contains(Pool, 'checkout', self._checkout):
+            event.listen(Pool, 'checkout', self._checkout)
+            event.listen(Pool, 'checkin', self._checkin)
+
+        if app.config.get('METRICS_URL'):
+            app.add_url_rule(
+                app.config['METRICS_URL'], 'metrics',
+                internal_only(self.report))
+
+        if multiprocess_dir():
+            at_worker_exit(mark_process_dead)
+
+    def _start_request(self):
+        g.request_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        start = g.pop('request_start', None)
+
+        if start is None:
+            return response
+
+        elapsed = time.perf_counter() - start
+        key = (request.endpoint or 'unmatched', request.method)
+
+        try:
+            latency, counts = self._request_metrics[key]
+
+        except KeyError:
+            latency, counts = self._request_metrics[key] = (
+                self.request_latency.labels(*key), {})
+
+        latency.observe(elapsed)
+
+        status = response.status_code
+        if status not in counts:
+            counts[status] = self.requests.labels(*key, status)
+        counts[status].inc()
+
+        return response
+
+    def _teardown_request(self, exc):
+        if exc is not None:
+            self.request_exceptions.labels(
+                request.endpoint or 'unmatched').inc()
+
+    def _checkout(self, dbapi_connection, connection_record,
+                  connection_proxy):
+        self.db_connections.inc()
+
+    def _checkin(self, dbapi_connection, connection_record):
+        self.db_connections.dec()
+
+    @contextlib.contextmanager
+    def external_timer(self, service, operation, expected=()):
+        """
+        Time a call to another service, counting it as an error if it raises
+        anything other than the expected exceptions. Yields a function to
+        call to count a call that returned an error as one.
+        """
+
+        start = time.perf_counter()
+
+        try:
+            yield lambda: self.external_errors.labels(service, operation).inc()
+
+        except expected:
+            raise
+
+        except Exception:
+            self.external_errors.labels(service, operation).inc()
+            raise
+
+        finally:
+            self.external_latency.labels(service, operation).observe(
+                time.perf_counter() - start)
+
+    def instrument_session(self, session, service):
+        """
+        Time every request made through a requests session, by HTTP method
+        """
+
+        send = session.send
+
+        def timed_send(prepared_request, **kwargs):
+            with self.external_timer(
+                    service, prepared_request.method) as failed:
+                response = send(prepared_request, **kwargs)
+
+                if response.status_code >= 500:
+                    failed()
+
+            return response
+
+        session.send = timed_send
+        return session
+
+    def report(self):
+
+        if multiprocess_dir():
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+
+        else:
+            registry = self.registry
+
+        return Response(
+            generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
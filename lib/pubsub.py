@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Publish/subscribe Flask extension, fanning messages out to waiting threads
+
+On its own, messages only reach subscribers in the same process. With
+PUBSUB_POSTGRES_URL set, they are relayed to every process through Postgres
+LISTEN/NOTIFY.
+"""
+
+from collections import defaultdict
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriberLimitReached(Exception):
+    pass
+
+
+class Subscription(object):
+
+    def __init__(self, pubsub, channel, maxsize):
+        self.pubsub = pubsub
+        self.channel = channel
+        self.messages = queue.Queue(maxsize)
+
+    def get(self, timeout=None):
+        """
+        Next message, or None if there isn't one within timeout seconds
+        """
+
+        try:
+            return self.messages.get(timeout=timeout)
+
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PostgresRelay(object):
+    """
+    Sends messages to every process with NOTIFY. Each process LISTENs on a
+    connection of its own, from a thread started on first use, and hands
+    what it hears to its local subscribers.
+    """
+
+    pg_channel = 'pubsub'
+
+    # keeps each payload well under Postgres' 8000 byte limit
+    channels_per_notify = 200
+
+    def __init__(self, url, pubsub, poll_interval=5):
+        self.url = url
+        self.pubsub = pubsub
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.listening = threading.Event()
+        self.pid = None
+        self.engines = {}
+
+    @property
+    def engine(self):
+        # XXX connections must not be shared with a parent process
+        pid = os.getpid()
+
+        with self.lock:
+            if pid not in self.engines:
+                self.engines = {pid: create_engine(
+                    # one connection to listen on, one to send with
+                    self.url, pool_size=2)}
+
+            return self.engines[pid]
+
+    def send(self, channels, message):
+        """
+        Send message to each of channels, on one connection, in one NOTIFY
+        per channels_per_notify channels
+        """
+
+        channels = list(channels)
+
+        # XXX NOTIFY is only delivered once its transaction commits
+        with self.engine.connect() as conn, conn.begin():
+
+            for start in range(0, len(channels), self.channels_per_notify):
+                conn.execute(
+                    text('SELECT pg_notify(:pg_channel, :payload)'),
+                    pg_channel=self.pg_channel,
+                    payload=json.dumps([
+                        channels[start:start + self.channels_per_notify],
+                        message]))
+
+    def start(self):
+        """
+        Start listening, unless already listening in this process, and wait
+        until the LISTEN has taken effect. The thread of a parent process
+        does not survive a fork.
+        """
+
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.listening.clear()
+
+                threading.Thread(
+                    target=self.run, name='pubsub-relay', daemon=True).start()
+
+        # XXX so subscribers miss nothing sent after they subscribed
+        self.listening.wait(self.poll_interval)
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+
+            except Exception:
+                logger.exception('Listening for %s failed', self.pg_channel)
+                time.sleep(self.poll_interval)
+
+    def listen(self):
+        conn = self.engine.raw_connection()
+
+        try:
+            dbapi_conn = conn.connection
+            dbapi_conn.autocommit = True
+            dbapi_conn.cursor().execute('LISTEN {}'.format(self.pg_channel))
+            self.listening.set()
+
+            while True:
+                select.select([dbapi_conn], [], [], self.poll_interval)
+                dbapi_conn.poll()
+
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    channels, message = json.loads(notify.payload)
+
+                    for channel in channels:
+                        self.pubsub.deliver(channel, message)
+
+        finally:
+            self.listening.clear()
+            conn.invalidate()
+
+
+class PubSub(object):
+
+    def __init__(self, app=None, maxsize=100, max_subscribers=None):
+        self.maxsize = maxsize
+        self.max_subscribers = max_subscribers
+        self.relay = None
+        self.subscriptions = defaultdict(set)
+        self.count = 0
+        self.lock = threading.Lock()
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_subscribers = app.config.get('PUBSUB_MAX_SUBSCRIBERS')
+
+        url = app.config.get('PUBSUB_POSTGRES_URL')
+        self.relay = PostgresRelay(url, self) if url else None
+
+    def subscribe(self, channel):
+        """
+        Raises SubscriberLimitReached if the process already has
+        max_subscribers
+        """
+
+        subscription = Subscription(self, channel, self.maxsize)
+
+        with self.lock:
+            if self.max_subscribers is not None and \
+                    self.count >= self.max_subscribers:
+                raise SubscriberLimitReached(channel)
+
+            self.subscriptions[channel].add(subscription)
+            self.count += 1
+
+        if self.relay:
+            self.relay.start()
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.channel, set())
+
+            if subscription in subscribers:
+                subscribers.discard(subscription)
+                self.count -= 1
+
+            if not subscribers:
+                self.subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, message):
+        """
+        Send message to every subscriber of channel. In process, returns how
+        many received it. Subscribers too far behind miss it.
+        """
+
+        return self.publish_many([channel], message)
+
+    def publish_many(self, channels, message):
+        """
+        Send message to the subscribers of each of channels at once, which
+        through Postgres costs one round trip rather than one per channel
+        """
+
+        if self.relay:
+            self.relay.send(channels, message)
+            return None
+
+        return sum(self.deliver(channel, message) for channel in channels)
+
+    def deliver(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscriptions.get(channel, ()))
+
+        delivered = 0
+
+        for subscription in subscribers:
+            try:
+                subscription.messages.put_nowait(message)
+                delivered += 1
+
+            except queue.Full:
+                pass
+
+        return delivered
+
+    def subscriber_count(self, channel):
+        with self.lock:
+            return len(self.subscriptions.get(channel, ()))
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Per-endpoint SQL query instrumentation Flask extension
+
+Counts and times every statement run through SQLAlchemy during a request,
+and keeps totals per endpoint. Views can declare how many queries they are
+expected to run with @query_budget.
+"""
+
+import threading
+import time
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from lib.internal_only import internal_only
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """
+    Declare the most queries a view should run. Going over is logged, or
+    raises QueryBudgetExceeded if QUERY_BUDGET_STRICT is set, as in tests.
+    """
+
+    def decorator(view):
+        view.query_budget = limit
+        return view
+
+    return decorator
+
+
+class RequestQueries(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.total += seconds
+
+        if seconds >= self.slowest:
+            self.slowest = seconds
+            self.slowest_statement = statement
+
+    def header(self):
+        return 'count={} time={:.1f}ms slowest={:.1f}ms'.format(
+            self.count, self.total * 1000, self.slowest * 1000)
+
+
+class QueryStats(object):
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+
+        if not event.contains(
+                Engine, 'before_cursor_execute', self._before_execute):
+            event.listen(
+                Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+
+        app.extensions['query_stats'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        if app.config.get('QUERY_STATS_URL'):
+            app.add_url_rule(
+                app.config['QUERY_STATS_URL'], 'query_stats',
+                internal_only(self.report))
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        conn.info.setdefault(id(self), []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        elapsed = time.perf_counter() - conn.info[id(self)].pop()
+
+        # the listeners see every engine, so only count for our own app
+        if not has_request_context() or 'queries' not in g:
+            return
+
+        if current_app.extensions.get('query_stats') is self:
+            g.queries.record(statement, elapsed)
+
+    def _start_request(self):
+        g.queries = RequestQueries()
+
+    def _finish_request(self, response):
+        queries = g.pop('queries', None)
+
+        if queries is None:
+            return response
+
+        endpoint = request.endpoint or 'unknown'
+        self.record(endpoint, queries)
+
+        if current_app.debug:
+            response.headers['X-Query-Stats'] = queries.header()
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+
+        if budget is not None and queries.count > budget:
+            message = '{} ran {} queries, over its budget of {}'.format(
+                endpoint, queries.count, budget)
+
+            if current_app.config.get('QUERY_BUDGET_STRICT'):
+                raise QueryBudgetExceeded(message)
+
+            current_app.logger.warning(message)
+
+        return response
+
+    def record(self, endpoint, queries):
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0,
+                'queries': 0,
+                'time': 0.0,
+                'max_queries': 0,
+                'slowest': 0.0,
+                'slowest_statement': None,
+            })
+            stats['requests'] += 1
+            stats['queries'] += queries.count
+            stats['time'] += queries.total
+            stats['max_queries'] = max(stats['max_queries'], queries.count)
+
+            if queries.slowest >= stats['slowest'] and queries.count:
+                stats['slowest'] = queries.slowest
+                stats['slowest_statement'] = queries.slowest_statement[:500]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: dict(
+                    stats,
+                    mean_queries=stats['queries'] / stats['requests'])
+                for endpoint, stats in self.endpoints.items()}
+
+    def report(self):
+        return jsonify(self.snapshot())
@@ -3,25 +3,156 @@
 Libsass output filter for flask-assets
 """
 
+import hashlib
+import os
+import re
+
 import sass
 from webassets.filter import Filter
 
 
+COMMENTS = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+IMPORTS = re.compile(r'@import\s+([^;]+);')
+
+
+def imported_names(src):
+    """
+    Names of the Sass files imported by a stylesheet, skipping plain CSS
+    imports which are left for the browser
+    """
+
+    for statement in IMPORTS.findall(COMMENTS.sub('', src)):
+        for name in statement.split(','):
+            name = name.strip().strip('\'"')
+
+            if name.startswith(('url(', 'http:', 'https:', '//')):
+                continue
+
+            if name.endswith('.css'):
+                continue
+
+            yield name
+
+
+def resolve_import(name, search_paths):
+    dirname, basename = os.path.split(name)
+    basename = os.path.splitext(basename)[0]
+
+    for path in search_paths:
+        for candidate in ('_{}.scss', '{}.scss', '_{}.sass', '{}.sass'):
+            filename = os.path.join(
+                path, dirname, candidate.format(basename))
+
+            if os.path.isfile(filename):
+                return os.path.abspath(filename)
+
+
+def import_graph(src, include_paths):
+    """
+    Every file reachable through @import from src, with its content
+    """
+
+    found = {}
+    pending = [(src, None)]
+
+    while pending:
+        text, dirname = pending.pop()
+        search_paths = ([dirname] if dirname else []) + list(include_paths)
+
+        for name in imported_names(text):
+            filename = resolve_import(name, search_paths)
+
+            if filename and filename not in found:
+                with open(filename, encoding='utf-8') as f:
+                    found[filename] = f.read()
+
+                pending.append(
+                    (found[filename], os.path.dirname(filename)))
+
+    return found
+
+
 class LibSass(Filter):
+    """
+    Compiles Sass with libsass, skipping compilation when neither the source,
+    nor anything it imports, nor the options have changed since last time.
+
+    Compiled output is kept in memory and, if SASS_CACHE_DIR is set, on disk
+    under a hash of its inputs, so the directory can be shared by workers
+    and kept between CI builds.
+    """
+
     name = 'libsass-output'
     options = {
-        'output_style': 'SASS_OUTPUT_STYLE'
+        'output_style': 'SASS_OUTPUT_STYLE',
+        'cache_dir': 'SASS_CACHE_DIR',
     }
 
     def __init__(self, include_paths=[], *args, **kwargs):
         super(LibSass, self).__init__(*args, **kwargs)
         self.include_paths = include_paths
+        self.compiled = {}
+
+    @property
+    def style(self):
+        return getattr(self, 'output_style', None) or 'expanded'
+
+    def cache_key(self, src, include_paths):
+        key = hashlib.sha256()
+
+        for part in (self.style, '\0'.join(include_paths), src):
+            key.update(part.encode('utf-8'))
+            key.update(b'\0')
+
+        for filename, text in sorted(import_graph(src, include_paths).items()):
+            key.update(filename.encode('utf-8'))
+            key.update(hashlib.sha256(text.encode('utf-8')).digest())
+
+        return key.hexdigest()
+
+    def cache_path(self, key):
+        cache_dir = getattr(self, 'cache_dir', None)
+
+        if cache_dir:
+            return os.path.join(cache_dir, '{}.css'.format(key))
+
+    def cached(self, key):
+
+        if key not in self.compiled:
+            path = self.cache_path(key)
+
+            if path and os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    self.compiled[key] = f.read()
+
+        return self.compiled.get(key)
+
+    def store(self, key, css):
+        self.compiled[key] = css
+        path = self.cache_path(key)
+
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(css)
+
+            os.replace(tmp_path, path)
 
     def _apply_sass(self, src):
-        return sass.compile(
-            string=src,
-            output_style='expanded',
-            include_paths=getattr(self, 'include_paths', []))
+        include_paths = getattr(self, 'include_paths', [])
+        key = self.cache_key(src, include_paths)
+        css = self.cached(key)
+
+        if css is None:
+            css = sass.compile(
+                string=src,
+                output_style=self.style,
+                include_paths=include_paths)
+            self.store(key, css)
+
+        return css
 
     def output(self, _in, out, **kwargs):
         out.write(self._apply_sass(_in.read()))
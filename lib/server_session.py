@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Server-side session Flask extension
+
+The session cookie carries only a signed, random session id. Session data
+is kept in a store, either files in a directory (for development and
+tests) or a database table (for production), and is only written back
+when it changes.
+"""
+
+import datetime
+import os
+import random
+import uuid
+
+from flask import current_app, session
+from flask.sessions import (
+    SecureCookieSessionInterface,
+    SessionInterface,
+    SessionMixin,
+    session_json_serializer)
+from flask_login import user_logged_in, user_logged_out
+from itsdangerous import BadSignature, Signer
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import CallbackDict
+
+from lib.private_dir import make_private_dir
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, expires=None):
+
+        def on_update(self):
+            self.modified = True
+
+        super(ServerSideSession, self).__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = sid is None
+        self.modified = False
+        self.rotated = False
+
+    def rotate(self):
+        """
+        Move the data to a new session id when the response is saved,
+        so an id known before a login or logout is no use after it
+        """
+
+        self.new = True
+        self.modified = True
+        self.rotated = True
+
+
+class FileSessionStore(object):
+    """
+    One file per session, with its modification time set to its expiry so
+    expired sessions can be purged without reading them
+    """
+
+    def __init__(self, directory):
+        # XXX other users must not read or plant sessions
+        self.directory = make_private_dir(directory)
+
+    def path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid):
+        try:
+            expires = os.path.getmtime(self.path(sid))
+
+            with open(self.path(sid)) as f:
+                data = f.read()
+
+        except FileNotFoundError:
+            return None
+
+        expires = datetime.datetime.utcfromtimestamp(expires)
+
+        if expires <= datetime.datetime.utcnow():
+            return None
+
+        return data, expires
+
+    def save(self, sid, data, expires, old_sid=None):
+        tmp_path = '{}.tmp'.format(self.path(sid))
+
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+
+        timestamp = (expires - datetime.datetime(1970, 1, 1)).total_seconds()
+        os.utime(tmp_path, (timestamp, timestamp))
+        os.replace(tmp_path, self.path(sid))
+
+        if old_sid:
+            self.delete(old_sid)
+
+    def delete(self, sid):
+        try:
+            os.unlink(self.path(sid))
+
+        except FileNotFoundError:
+            pass
+
+    def purge(self):
+        now = datetime.datetime.utcnow()
+        purged = 0
+
+        for entry in os.scandir(self.directory):
+            expires = datetime.datetime.utcfromtimestamp(
+                entry.stat().st_mtime)
+
+            if expires <= now:
+                self.delete(entry.name)
+                purged += 1
+
+        return purged
+
+
+class ModelSessionStore(object):
+    """
+    Sessions in a table with sid, data and expires columns, see
+    ServerSession.model_class. Uses its own statements rather than the ORM
+    session, so saving a session never flushes or commits other changes.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.table = model.__table__
+
+    def execute(self, statement):
+        return self.model.query.session.get_bind().execute(statement)
+
+    def load(self, sid):
+        row = self.execute(self.table.select().where(
+            self.table.c.sid == sid).where(
+            self.table.c.expires > datetime.datetime.utcnow())).first()
+
+        if row:
+            return row.data, row.expires
+
+    def save(self, sid, data, expires, old_sid=None):
+        values = {'sid': sid, 'data': data, 'expires': expires}
+
+        # XXX a rotated session moves its row to the new sid, so rotating
+        # costs no more writes than saving
+        if old_sid and self.execute(self.table.update().where(
+                self.table.c.sid == old_sid).values(**values)).rowcount:
+            return
+
+        update = self.table.update().where(
+            self.table.c.sid == sid).values(**values)
+
+        if self.execute(update).rowcount:
+            return
+
+        try:
+            self.execute(self.table.insert().values(**values))
+
+        # XXX a concurrent request for the same session inserted first
+        except IntegrityError:
+            self.execute(update)
+
+    def delete(self, sid):
+        self.execute(self.table.delete().where(self.table.c.sid == sid))
+
+    def purge(self):
+        return self.execute(self.table.delete().where(
+            self.table.c.expires <= datetime.datetime.utcnow())).rowcount
+
+
+class ServerSessionInterface(SessionInterface):
+    salt = 'server-session'
+    serializer = session_json_serializer
+
+    def __init__(self, store, purge_probability=0.01):
+        self.store = store
+        self.purge_probability = purge_probability
+
+    def signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def lifetime(self, app):
+        return app.permanent_session_lifetime
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(app.session_cookie_name)
+
+        if cookie and app.secret_key:
+            try:
+                sid = self.signer(app).unsign(cookie).decode('utf-8')
+
+            except BadSignature:
+                sid = None
+
+            stored = self.store.load(sid) if sid else None
+
+            if stored:
+                data, expires = stored
+                return ServerSideSession(
+                    self.serializer.loads(data), sid=sid, expires=expires)
+
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        old_sid = session.sid if session.rotated else None
+
+        if not session:
+
+            if session.sid:
+                self.store.delete(session.sid)
+
+            if not session.new or session.rotated:
+                response.delete_cookie(
+                    app.session_cookie_name, domain=domain, path=path)
+
+            return
+
+        if not self.needs_saving(app, session):
+            return
+
+        if session.new:
+            session.sid = uuid.uuid4().hex
+
+        session.expires = datetime.datetime.utcnow() + self.lifetime(app)
+        self.store.save(
+            session.sid, self.serializer.dumps(dict(session)), session.expires,
+            old_sid)
+
+        if random.random() < self.purge_probability:
+            self.store.purge()
+
+        response.set_cookie(
+            app.session_cookie_name,
+            self.signer(app).sign(session.sid.encode('utf-8')).decode(
+                'utf-8'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app))
+
+    def needs_saving(self, app, session):
+        if session.new or session.modified:
+            return True
+
+        # extend sessions still in use once they are half way to expiring
+        remaining = session.expires - datetime.datetime.utcnow()
+        return remaining < self.lifetime(app) / 2
+
+
+def rotate_session(sender, **extra):
+    if isinstance(session._get_current_object(), ServerSideSession):
+        session.rotate()
+
+
+class ServerSession(object):
+
+    def __init__(self, app=None):
+        self._model_class = None
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('SESSION_BACKEND', 'cookie')
+
+        if backend == 'cookie':
+            app.session_interface = SecureCookieSessionInterface()
+            return
+
+        app.session_interface = ServerSessionInterface(
+            self.make_store(app, backend),
+            app.config.get('SESSION_PURGE_PROBABILITY', 0.01))
+
+        user_logged_in.connect(rotate_session, app)
+        user_logged_out.connect(rotate_session, app)
+
+    def make_store(self, app, backend):
+
+        if backend == 'file':
+            return FileSessionStore(app.config['SESSION_FILE_DIR'])
+
+        if backend == 'database':
+            return ModelSessionStore(self._model_class)
+
+        raise ValueError('Unknown session backend {}'.format(backend))
+
+    def purge(self):
+        """
+        Remove expired sessions, returning how many were removed
+        """
+        interface = current_app.session_interface
+
+        if isinstance(interface, ServerSessionInterface):
+            return interface.store.purge()
+
+        return 0
+
+    def model_class(self, cls):
+        self._model_class = cls
+        return cls
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Measure app import and initialisation time in a fresh interpreter
+
+    python -m lib.startup_profile
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def profile_startup(fast_boot=False):
+    """
+    Run create_app in a new process, so imports are not already cached, and
+    return its timings in seconds
+    """
+
+    env = dict(os.environ)
+    if fast_boot:
+        env['FAST_BOOT'] = '1'
+
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'lib.startup_profile'], env=env)
+
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def main():
+    start = time.perf_counter()
+    from app.factory import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+
+    timings = [('import app.factory', imported - start)]
+    timings.extend(app.startup_timings.items())
+    timings.append(('total', created - start))
+
+    print(json.dumps(timings))
+
+
+if __name__ == '__main__':
+    main()
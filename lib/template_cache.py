@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Jinja bytecode and fragment caches
+"""
+
+import os
+import threading
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from lib.private_dir import make_private_dir
+
+
+class SharedBytecodeCache(FileSystemBytecodeCache):
+    """
+    Bytecode cache safe to share between worker processes, as each file is
+    written in full before it replaces any previous one. Bytecode is run as
+    loaded, so the directory must be private to this user.
+    """
+
+    def __init__(self, directory):
+        super(SharedBytecodeCache, self).__init__(make_private_dir(directory))
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        tmp_filename = '{}.{}.{}.tmp'.format(
+            filename, os.getpid(), threading.get_ident())
+
+        with open(tmp_filename, 'wb') as f:
+            bucket.write_bytecode(f)
+
+        os.replace(tmp_filename, filename)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Renders the body of {% cache "name" %}...{% endcache %} once and reuses
+    the output. Only for markup that is the same for every request.
+    Disabled by setting environment.fragment_cache_enabled to False.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(
+            fragment_cache={},
+            fragment_cache_enabled=True)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = nodes.Const('{}:{}'.format(parser.name, lineno))
+        name = parser.parse_expression()
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        return nodes.CallBlock(
+            self.call_method('_cache', [key, name]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache(self, location, name, caller):
+        if not self.environment.fragment_cache_enabled:
+            return caller()
+
+        cache = self.environment.fragment_cache
+        key = (location, name)
+
+        if key not in cache:
+            cache[key] = caller()
+
+        return cache[key]
@@ -1,13 +1,14 @@
 #!/usr/bin/env python
 
 import os
+import time
 
 from flask_assets import ManageAssets
 from flask_migrate import MigrateCommand
 from flask_script import Manager
 from flask_security.utils import encrypt_password
 
-from app.extensions import user_datastore
+from app.extensions import notify, user_datastore
 from app.factory import create_app
 
 
@@ -80,5 +81,72 @@ def runserver_ssl():
         ssl_context=('server.crt', 'server.key'))
 
 
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=100)
+@manager.option('-w', '--workers', dest='workers', type=int, default=10)
+@manager.option('-i', '--interval', dest='interval', type=float, default=5)
+@manager.option('--once', dest='once', action='store_true', default=False)
+def notify_worker(batch_size, workers, interval, once):
+    """Send queued GOV.UK Notify messages"""
+    from app.main.tasks import dispatch_notifications
+
+    if notify.disabled:
+        print('GOV.UK Notify is disabled')
+        return
+
+    while True:
+        attempted = dispatch_notifications(batch_size, max_workers=workers)
+
+        if once:
+            break
+
+        # a full batch means there is probably more waiting
+        if attempted < batch_size:
+            time.sleep(interval)
+
+
+@manager.command
+def purge_sessions():
+    """Remove expired server-side sessions"""
+    from app.extensions import server_session
+
+    print('Removed {} expired sessions'.format(server_session.purge()))
+
+
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=500)
+@manager.option('-w', '--workers', dest='workers', type=int, default=10)
+def reconcile_payments(chunk_size, workers):
+    """Refresh the status of unfinished payments from GOV.UK Pay"""
+    from app.main.tasks import reconcile_payments
+
+    stats = reconcile_payments(chunk_size, max_workers=workers)
+
+    print('Checked {checked} payments in {elapsed:.1f}s '
+          '({per_second:.1f}/s)'.format(**stats))
+    print('{updated} updated, {finished} now finished, '
+          '{errors} errors'.format(**stats))
+    print('Payment age: mean {mean_lag:.0f}s, '
+          'max {max_lag:.0f}s'.format(**stats))
+
+
+@manager.command
+def build_assets():
+    """Compile asset bundles to fingerprinted, precompressed files"""
+    from app.assets import env
+    from lib.asset_manifest import build_assets
+
+    output_dir = manager.app.config['ASSETS_OUTPUT_DIR']
+    for name, entry in sorted(build_assets(env, output_dir).items()):
+        print('{:<20} {}'.format(name, entry['path']))
+
+
+@manager.option('--fast', dest='fast', action='store_true', default=False)
+def profile_startup(fast):
+    """Report import and initialisation time of the app and its extensions"""
+    from lib.startup_profile import profile_startup
+
+    for name, seconds in profile_startup(fast_boot=fast):
+        print('{:<20} {:8.1f} ms'.format(name, seconds * 1000))
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,23 @@
+"""index suits by creation date for admin listing
+
+Revision ID: 3c1f0a7d92b4
+Revises: 21bf9a95620d
+Create Date: 2026-10-18 09:12:41.530162
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c1f0a7d92b4'
+down_revision = '21bf9a95620d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index(
+        'ix_suit_created_id', 'suit', ['created', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_suit_created_id', table_name='suit')
@@ -0,0 +1,38 @@
+"""add outbound notification queue
+
+Revision ID: 5d2e8f6a41c3
+Revises: 9e4b7c1d05aa
+Create Date: 2026-10-18 11:26:52.710934
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8f6a41c3'
+down_revision = '9e4b7c1d05aa'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('outbound_notification',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('endpoint', sa.String(length=50), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=True),
+    sa.Column('next_attempt', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('sent', sa.DateTime(), nullable=True),
+    sa.Column('failed', sa.Boolean(), nullable=True),
+    sa.Column('error', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_outbound_notification'))
+    )
+    with op.batch_alter_table('outbound_notification', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_outbound_notification_next_attempt'), ['next_attempt'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('outbound_notification', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_outbound_notification_next_attempt'))
+
+    op.drop_table('outbound_notification')
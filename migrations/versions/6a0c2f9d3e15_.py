@@ -0,0 +1,32 @@
+"""server-side sessions
+
+Revision ID: 6a0c2f9d3e15
+Revises: b81f3e2c7d90
+Create Date: 2026-10-18 15:20:42.308117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a0c2f9d3e15'
+down_revision = 'b81f3e2c7d90'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('stored_session',
+    sa.Column('sid', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('expires', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('sid', name=op.f('pk_stored_session'))
+    )
+    with op.batch_alter_table('stored_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stored_session_expires'), ['expires'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stored_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stored_session_expires'))
+
+    op.drop_table('stored_session')
@@ -0,0 +1,26 @@
+"""index suits by plaintiff and creation date
+
+Revision ID: 9e4b7c1d05aa
+Revises: 3c1f0a7d92b4
+Create Date: 2026-10-18 10:03:17.284410
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7c1d05aa'
+down_revision = '3c1f0a7d92b4'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index(
+        'ix_suit_plaintiff_id_created',
+        'suit',
+        ['plaintiff_id', sa.text('created DESC')],
+        unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_suit_plaintiff_id_created', table_name='suit')
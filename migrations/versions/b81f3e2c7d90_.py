@@ -0,0 +1,30 @@
+"""index users by email and name prefix
+
+Revision ID: b81f3e2c7d90
+Revises: 5d2e8f6a41c3
+Create Date: 2026-10-18 14:41:05.918203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b81f3e2c7d90'
+down_revision = '5d2e8f6a41c3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # text_pattern_ops lets Postgres use the index for LIKE 'prefix%'
+    # whatever the database collation
+    op.create_index(
+        'ix_user_email_prefix', 'user', ['email'], unique=False,
+        postgresql_ops={'email': 'text_pattern_ops'})
+    op.create_index(
+        'ix_user_name_prefix', 'user', ['name'], unique=False,
+        postgresql_ops={'name': 'text_pattern_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_user_name_prefix', table_name='user')
+    op.drop_index('ix_user_email_prefix', table_name='user')
@@ -3,6 +3,7 @@ import datetime
 import mock
 import os
 import subprocess
+import tempfile
 
 from flask_migrate import upgrade
 import pytest
@@ -11,7 +12,7 @@ import sqlalchemy
 
 from app.main.models import User
 from app.config import SQLALCHEMY_DATABASE_URI
-from app.extensions import db as _db, user_datastore
+from app.extensions import cache, db as _db, user_datastore
 from app.factory import create_app
 from tests.oidc_testbed import MockOIDCProvider
 
@@ -44,6 +45,13 @@ def app(provider):
         'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URI,
         'PREFERRED_URL_SCHEME': 'http',
         'WTF_CSRF_ENABLED': False,
+        'QUERY_BUDGET_STRICT': True,
+        'SESSION_BACKEND': 'file',
+        'SESSION_FILE_DIR': tempfile.mkdtemp(),
+        'OIDC_DISCOVERY_CACHE_DIR': tempfile.mkdtemp(),
+        'JINJA_CACHE_DIR': tempfile.mkdtemp(),
+        'PUBSUB_POSTGRES_URL': TEST_DATABASE_URI
+        if TEST_DATABASE_URI.startswith('postgres') else None,
         'OIDC_CLIENT': {
             'issuer': config['issuer'],
             'client_id': 'test-client',
@@ -140,6 +148,9 @@ def db_session(db, request):
     connection.close()
     session.remove()
 
+    # rolled back rows may still be cached
+    cache.clear()
+
 
 @pytest.fixture
 def selenium(db, live_server, selenium):
@@ -1,6 +1,26 @@
+"""
+Mock OpenID Connect provider and client
+
+MockOIDCProvider plugs into `responses` for unit tests. OIDCProviderServer
+serves the same endpoints over HTTP for load tests, standalone with
+
+    python -m tests.oidc_testbed --port 5556 --latency 0.05
+"""
+
+import argparse
+import base64
+import functools
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import itertools
 import json
 from io import BytesIO
+import queue
+import random
+from socketserver import ThreadingMixIn
+import sys
+import threading
 import time
+from types import SimpleNamespace
 from urllib.parse import urlparse
 
 from jwkest import jws
@@ -20,9 +40,102 @@ import requests
 import responses
 
 
+SIGNING_KEY = 'signing_key.pem'
+
+
+@functools.lru_cache()
+def load_signing_key(path=SIGNING_KEY):
+    """
+    Signing key, parsed once per process
+    """
+
+    return RSAKey(key=rsa_load(path), alg='RS256')
+
+
+@functools.lru_cache()
+def load_private_key(path=SIGNING_KEY):
+    """
+    The same key for `cryptography`, or None if it isn't installed
+    """
+
+    try:
+        # optional dependency, installed with recent versions of oic
+        from cryptography.hazmat.primitives import serialization
+
+    except ImportError:
+        return None
+
+    with open(path, 'rb') as f:
+        return serialization.load_pem_private_key(f.read(), None)
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+class IdTokenSigner(object):
+    """
+    Signs ID tokens with RS256, using `cryptography` if installed,
+    otherwise the much slower jwkest
+    """
+
+    def __init__(self, path=SIGNING_KEY):
+        self.key = load_signing_key(path)
+        self.private_key = load_private_key(path)
+        self.header = b64encode(json.dumps({'alg': 'RS256'}).encode('utf-8'))
+
+        if self.private_key is not None:
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.asymmetric import padding
+            self.padding = padding.PKCS1v15()
+            self.hash = hashes.SHA256()
+
+    def sign(self, claims):
+
+        if self.private_key is None:
+            return IdToken(**claims).to_jwt([self.key], 'RS256')
+
+        message = self.header + b'.' + b64encode(
+            json.dumps(claims).encode('utf-8'))
+        signature = self.private_key.sign(message, self.padding, self.hash)
+
+        return (message + b'.' + b64encode(signature)).decode('ascii')
+
+
+class TokenPool(object):
+    """
+    Access tokens and their hashes, minted ahead of use by a background
+    thread, falling back to minting on demand if the pool runs dry
+    """
+
+    def __init__(self, size=1000):
+        self.tokens = queue.Queue(size)
+
+        if size:
+            thread = threading.Thread(target=self._fill)
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def mint():
+        value = rndstr(32)
+        return value, jws.left_hash(value.encode('utf-8'), 'HS256')
+
+    def _fill(self):
+        while True:
+            self.tokens.put(self.mint())
+
+    def get(self):
+        try:
+            return self.tokens.get_nowait()
+
+        except queue.Empty:
+            return self.mint()
+
+
 class MockOIDCProvider(Server):
 
-    def __init__(self, patch, config={}):
+    def __init__(self, patch, config={}, token_pool_size=0):
         Server.__init__(self)
         self.patch = patch
         self.session = None
@@ -51,13 +164,31 @@ class MockOIDCProvider(Server):
         self.registration_expires_in = 3600
         self.host = ''
         self.userinfo_signed_response_alg = ''
-        self.signing_key = RSAKey(key=rsa_load('signing_key.pem'), alg='RS256')
+        self.signing_key = load_signing_key()
+        self.signer = IdTokenSigner()
+        self.token_pool = TokenPool(token_pool_size)
         self.urls = []
 
     @property
     def calls(self):
         return self.patch.calls
 
+    def authenticate(self, auth_req):
+        """
+        Subject of the user signing in with this authorization request
+        """
+
+        return 'test-sub'
+
+    def userinfo(self, sub):
+        return {
+            'sub': sub,
+            'name': 'Test User',
+            'nickname': 'Tester',
+            'email': 'tester@example.com',
+            'verified': True,
+        }
+
     def init_endpoints(self):
         url = '{issuer}/.well-known/openid-configuration'.format(**self.config)
         self.openid_configuration = MockProviderConfig(url, self)
@@ -113,8 +244,15 @@ class MockEndpoint(object):
 
 class MockProviderConfig(MockEndpoint):
 
+    def __init__(self, url, provider):
+        MockEndpoint.__init__(self, url, provider)
+        self.body = json.dumps(self.metadata())
+
     def __call__(self, request):
-        config = {
+        return (200, {'Content-Type': 'application/json'}, self.body)
+
+    def metadata(self):
+        return {
             'issuer': self.config['issuer'],
             'authorization_endpoint': '{issuer}/auth'.format(**self.config),
             'jwks_uri': '{issuer}/keys'.format(**self.config),
@@ -131,14 +269,17 @@ class MockProviderConfig(MockEndpoint):
             'token_endpoint_auth_methods_supported': ['client_secret_basic'],
             'claims_parameter_supported': True
         }
-        return (200, {'Content-Type': 'application/json'}, json.dumps(config))
 
 
 class MockJwks(MockEndpoint):
 
+    def __init__(self, url, provider):
+        MockEndpoint.__init__(self, url, provider)
+        self.body = json.dumps(
+            {'keys': [self.provider.signing_key.serialize()]})
+
     def __call__(self, request):
-        keys = {'keys': [self.provider.signing_key.serialize()]}
-        return (200, {'Content-Type': 'application/json'}, json.dumps(keys))
+        return (200, {'Content-Type': 'application/json'}, self.body)
 
 
 class MockAuthorizationEndpoint(MockEndpoint):
@@ -155,7 +296,7 @@ class MockAuthorizationEndpoint(MockEndpoint):
             authz_info = {
                 'used': False,
                 'exp': time.time() + self.provider.authorization_code_lifetime,
-                'sub': 'test-sub',
+                'sub': self.provider.authenticate(req),
                 'granted_scope': ' '.join(req['scope']),
                 'auth_req': req.to_dict()
             }
@@ -196,18 +337,18 @@ class MockTokenEndpoint(MockEndpoint):
 
             authz_info['used'] = True
 
+            at_value, at_hash = self.provider.token_pool.get()
+
             access_token = {
-                'value': rndstr(),
+                'value': at_value,
                 'expires_in': self.provider.access_token_lifetime,
                 'type': 'Bearer'
             }
 
-            at_value = access_token['value']
-
             self.provider.access_tokens[at_value] = {
                 'iat': time.time(),
                 'exp': time.time() + self.provider.access_token_lifetime,
-                'sub': 'test-sub',
+                'sub': authz_info['sub'],
                 'client_id': client_id,
                 'aud': [client_id],
                 'scope': authz_info['granted_scope'],
@@ -223,24 +364,21 @@ class MockTokenEndpoint(MockEndpoint):
 
             resp['refresh_token'] = None
 
-            args = {
+            now = int(time.time())
+            id_token = {
+                'iss': self.config['issuer'],
+                'sub': authz_info['sub'],
+                'aud': client_id,
+                'iat': now,
+                'exp': now + self.provider.id_token_lifetime,
                 'c_hash': jws.left_hash(authz_code.encode('utf-8'), 'HS256'),
-                'at_hash': jws.left_hash(at_value.encode('utf-8'), 'HS256'),
+                'at_hash': at_hash,
             }
 
-            id_token = IdToken(
-                iss=self.config['issuer'],
-                sub='test-sub',
-                aud=client_id,
-                iat=time.time(),
-                exp=time.time() + self.provider.id_token_lifetime,
-                **args)
-
             if 'nonce' in auth_req:
                 id_token['nonce'] = auth_req['nonce']
 
-            resp['id_token'] = id_token.to_jwt(
-                [self.provider.signing_key], 'RS256')
+            resp['id_token'] = self.provider.signer.sign(id_token)
 
             json_data = resp.to_json()
 
@@ -263,17 +401,11 @@ class MockUserinfoEndpoint(MockEndpoint):
     def __call__(self, request):
         data = request.body
 
-        self.provider.parse_user_info_request(data)
-
-        _info = {
-            'sub': 'test-sub',
-            'name': 'Test User',
-            'nickname': 'Tester',
-            'email': 'tester@example.com',
-            'verified': True,
-        }
+        req = self.provider.parse_user_info_request(data)
+        token = self.provider.access_tokens.get(req.get('access_token'), {})
 
-        resp = OpenIDSchema(**_info)
+        resp = OpenIDSchema(
+            **self.provider.userinfo(token.get('sub', 'test-sub')))
 
         userinfo = resp.to_json()
 
@@ -420,3 +552,174 @@ class MockOIDCClient(object):
             raise ValueError('sub does not match')
 
         return userinfo
+
+
+class LoadTestProvider(MockOIDCProvider):
+    """
+    Provider signing in a new user for every authorization, or cycling
+    through a fixed number of them
+    """
+
+    def __init__(self, patch, config={}, users=0, token_pool_size=1000):
+        MockOIDCProvider.__init__(self, patch, config, token_pool_size)
+        self.users = users
+        self.counter = itertools.count()
+        self.userinfo_cache = {}
+
+    def authenticate(self, auth_req):
+        n = next(self.counter)
+
+        if self.users:
+            n %= self.users
+
+        return 'user-{}'.format(n)
+
+    def userinfo(self, sub):
+        info = self.userinfo_cache.get(sub)
+
+        if info is None:
+            # create_user() records the issuer from userinfo
+            info = self.userinfo_cache[sub] = {
+                'iss': self.config['issuer'],
+                'sub': sub,
+                'name': 'User {}'.format(sub),
+                'email': '{}@example.com'.format(sub),
+                'verified': True,
+            }
+
+        return info
+
+
+class OIDCProviderServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves a mock provider's endpoints over HTTP, each response delayed by
+    `latency` seconds plus up to `jitter` more. The endpoints register
+    themselves with add_callback(), as they would with `responses`.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, issuer=None, latency=0,
+                 jitter=0, provider_class=LoadTestProvider, **kwargs):
+        HTTPServer.__init__(self, (host, port), ProviderRequestHandler)
+        self.callbacks = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.provider = provider_class(
+            self, {'issuer': issuer or self.url}, **kwargs)
+        self.provider.init_endpoints()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def add_callback(self, method, url, callback):
+        self.callbacks[method, urlparse(url).path] = callback
+
+    def delay(self):
+        delay = self.latency
+
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+
+        if delay:
+            time.sleep(delay)
+
+    def __enter__(self):
+        # poll often, so tests aren't kept waiting to shut it down
+        self.thread = threading.Thread(
+            target=self.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class ProviderRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive, as the app's client pools connections
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        callback = self.server.callbacks.get(
+            (self.command, urlparse(self.path).path))
+
+        self.server.delay()
+
+        if callback is None:
+            status, headers, payload = 404, {}, ''
+
+        else:
+            status, headers, payload = callback(SimpleNamespace(
+                method=self.command,
+                url=self.server.url + self.path,
+                headers=self.headers,
+                body=body))
+
+        payload = payload.encode('utf-8')
+        self.send_response(status)
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Serve a mock OpenID Connect provider')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=5556)
+    parser.add_argument('-i', '--issuer',
+                        help='defaults to http://<host>:<port>')
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='seconds each response is delayed')
+    parser.add_argument('-j', '--jitter', type=float, default=0.0,
+                        help='up to this many seconds more, at random')
+    parser.add_argument('-u', '--users', type=int, default=0,
+                        help='users to cycle through, 0 for a new one each')
+    parser.add_argument('--token-pool-size', type=int, default=1000)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    server = OIDCProviderServer(
+        args.host, args.port,
+        issuer=args.issuer,
+        latency=args.latency,
+        jitter=args.jitter,
+        users=args.users,
+        token_pool_size=args.token_pool_size)
+
+    print('Serving {} on {}'.format(
+        server.provider.config['issuer'], server.url))
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Test admin pages
+"""
+
+import datetime
+import time
+
+import mock
+import pytest
+from bs4 import BeautifulSoup
+from flask import url_for
+
+from app.extensions import suit_events
+from app.main.models import OutboundNotification, Suit, User
+from app.main.views import suit_status
+from lib.notify import Notification, Notify
+
+
+@pytest.fixture
+def suits(db_session):
+    plaintiff = User(email='plaintiff@example.com', name='Plaintiff')
+    created = datetime.datetime(2016, 8, 1, 12, 0, 0)
+    suits = [
+        Suit(
+            plaintiff=plaintiff,
+            defendant=User(name='Brother {}'.format(i)),
+            created=created + datetime.timedelta(minutes=i))
+        for i in range(5)]
+    db_session.add_all(suits)
+    db_session.commit()
+    return suits
+
+
+@pytest.yield_fixture
+def page_size(app):
+    with mock.patch.dict(app.config, {'ADMIN_PAGE_SIZE': 2}):
+        yield 2
+
+
+def get_soup(client, url):
+    response = client.get(url)
+    response.soup = BeautifulSoup(
+        response.get_data(as_text=True), 'html.parser')
+    return response
+
+
+def defendants(response):
+    return [
+        row.find_all('td')[2].text
+        for row in response.soup.find('tbody').find_all('tr')]
+
+
+class WhenListingSuits(object):
+
+    def it_shows_newest_suits_first(
+            self, client, admin_logged_in, suits, page_size):
+        response = get_soup(client, url_for('main.admin_suits'))
+
+        assert defendants(response) == ['Brother 4', 'Brother 3']
+
+    def it_links_to_the_next_page(
+            self, client, admin_logged_in, suits, page_size):
+        response = get_soup(client, url_for('main.admin_suits'))
+        next_url = response.soup.find('a', class_='next-page')['href']
+
+        response = get_soup(client, next_url)
+
+        assert defendants(response) == ['Brother 2', 'Brother 1']
+
+    def it_omits_next_link_on_last_page(
+            self, client, admin_logged_in, suits, page_size):
+        cursor = '{:%Y%m%d%H%M%S%f}.{}'.format(suits[1].created, suits[1].id)
+        response = get_soup(
+            client, url_for('main.admin_suits', after=cursor))
+
+        assert defendants(response) == ['Brother 0']
+        assert response.soup.find('a', class_='next-page') is None
+
+    def it_rejects_malformed_cursors(self, client, admin_logged_in):
+        response = client.get(url_for('main.admin_suits', after='nope'))
+
+        assert response.status_code == 400
+
+
+@pytest.fixture
+def users(db_session):
+    users = [
+        User(email='user{}@example.com'.format(i), name='User {}'.format(i))
+        for i in range(3)]
+    users.append(User(email='other@example.com', name='Other'))
+    db_session.add_all(users)
+    db_session.commit()
+    return users
+
+
+def get_users(client, url):
+    # each visit requires a fresh authentication
+    with client.session_transaction() as session:
+        session['auth_state'] = session['callback_state'] = 'state'
+
+    response = get_soup(client, url)
+    return response, [
+        field['value']
+        for field in response.soup.find_all('input', attrs={'name': 'email'})]
+
+
+class WhenListingUsers(object):
+
+    def it_filters_by_email_prefix(
+            self, client, admin_logged_in, users, page_size):
+        response, emails = get_users(
+            client, url_for('main.admin_users', q='other'))
+
+        assert emails == ['other@example.com']
+
+    def it_filters_by_name_prefix(
+            self, client, admin_logged_in, users, page_size):
+        response, emails = get_users(
+            client, url_for('main.admin_users', q='User 1'))
+
+        assert emails == ['user1@example.com']
+
+    def it_pages_through_users(
+            self, client, admin_logged_in, users, page_size):
+        response, emails = get_users(
+            client, url_for('main.admin_users', q='user'))
+        assert emails == ['user2@example.com', 'user1@example.com']
+
+        next_url = response.soup.find('a', class_='next-page')['href']
+        response, emails = get_users(client, next_url)
+
+        assert emails == ['user0@example.com']
+
+    def it_shows_flashed_messages_once(
+            self, client, admin_logged_in, users, page_size):
+        with client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Updated user')]
+
+        response, _ = get_users(client, url_for('main.admin_users'))
+
+        assert 'Updated user' in response.soup.text
+
+        with client.session_transaction() as session:
+            assert '_flashes' not in session
+
+
+class WhenEditingUsers(object):
+
+    def it_refreshes_the_status_of_their_suits(
+            self, client, admin_logged_in, suits):
+        suit = suits[0]
+        suit_status(suit.id)
+
+        client.post(
+            url_for('main.update_user', user=suit.defendant.id),
+            data={'name': 'Renamed', 'email': '', 'mobile': '',
+                  'superadmin': '', 'accept_suits': ''})
+
+        assert suit_status(suit.id)['defendant_name'] == 'Renamed'
+
+    def it_refreshes_the_status_of_their_suits_on_deletion(
+            self, client, admin_logged_in, suits):
+        suit = suits[0]
+        suit_status(suit.id)
+
+        client.post(url_for('main.delete_user', user=suit.defendant.id))
+
+        assert suit_status(suit.id)['defendant_name'] is None
+
+
+@pytest.yield_fixture
+def outbox(db_session):
+    client = Notify()
+    client.base_url = 'http://notify.example.com'
+    client._outbox_class = OutboundNotification
+    client.notifications['accept'] = Notification(client, 'accept-template')
+
+    with mock.patch('app.main.views.notify', client):
+        yield OutboundNotification
+
+
+@pytest.fixture
+def bulk_update(client, admin_logged_in):
+
+    def bulk_update(action, **data):
+        with client.session_transaction() as session:
+            session['iat'] = int(time.time())
+
+        return client.post(
+            url_for('main.bulk_update_suits'),
+            data=dict(data, action=action))
+
+    return bulk_update
+
+
+class WhenUpdatingSuitsInBulk(object):
+
+    def it_accepts_the_selected_suits(
+            self, bulk_update, suits, outbox, db_session):
+        selected = [suits[0].id, suits[2].id]
+
+        response = bulk_update('accept', suit=selected)
+
+        assert response.status_code == 302
+        assert sorted(
+            suit.id for suit in Suit.query.filter(Suit.accepted.isnot(None))
+        ) == selected
+        assert [message.data['personalisation'] for message in outbox.query] \
+            == [{'plaintiff': 'Plaintiff', 'defendant': 'Brother 0'},
+                {'plaintiff': 'Plaintiff', 'defendant': 'Brother 2'}]
+
+    def it_accepts_all_paid_suits_awaiting_review(
+            self, bulk_update, suits, outbox, db_session):
+        suits[1].confirmed = suits[3].confirmed = datetime.datetime.utcnow()
+        suits[3].accepted = datetime.datetime.utcnow()
+        db_session.commit()
+
+        bulk_update('accept', selection='pending')
+
+        assert outbox.query.count() == 1
+        assert outbox.query.one().data['personalisation']['defendant'] == \
+            'Brother 1'
+
+    def it_rejects_the_selected_suits(self, bulk_update, suits, db_session):
+        bulk_update('reject', suit=[suits[1].id, suits[4].id])
+
+        assert [suit.defendant.name for suit in Suit.query.order_by(Suit.id)] \
+            == ['Brother 0', 'Brother 2', 'Brother 3']
+
+    def it_publishes_the_changes_in_one_batch(
+            self, bulk_update, suits, db_session):
+        selected = [suits[1].id, suits[4].id]
+
+        with mock.patch.object(suit_events, 'publish_many') as publish_many:
+            bulk_update('reject', suit=selected)
+
+        publish_many.assert_called_once_with(selected, 'rejected')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Test prebuilt asset bundles
+"""
+
+import gzip
+import os
+
+from flask import Flask
+import pytest
+
+from app.assets import env
+from lib.asset_manifest import AssetManifest, build_assets
+
+
+@pytest.fixture
+def built(app, tmpdir):
+    output_dir = str(tmpdir)
+    return output_dir, build_assets(env, output_dir)
+
+
+@pytest.fixture
+def asset_app(built):
+    output_dir, _ = built
+    asset_app = Flask(__name__)
+    asset_app.config['ASSETS_OUTPUT_DIR'] = output_dir
+    AssetManifest(asset_app)
+    return asset_app
+
+
+class WhenBuildingAssets(object):
+
+    def it_writes_a_fingerprinted_file_per_bundle(self, built):
+        output_dir, manifest = built
+
+        assert set(manifest) == {'css_main', 'css_govuk_elements'}
+
+        filename = manifest['css_main']['path']
+        assert filename.startswith('main.')
+        assert os.path.exists(os.path.join(output_dir, 'manifest.json'))
+
+        with open(os.path.join(output_dir, filename), 'rb') as f:
+            css = f.read()
+
+        with gzip.open(os.path.join(output_dir, filename + '.gz')) as f:
+            assert f.read() == css
+
+
+class WhenServingPrebuiltAssets(object):
+
+    def it_resolves_urls_from_the_manifest(self, asset_app, built):
+        _, manifest = built
+
+        with asset_app.test_request_context():
+            url = asset_app.jinja_env.globals['asset_url']('css_main')
+
+        assert url == '/assets/' + manifest['css_main']['path']
+
+    def it_sends_a_precompressed_variant_cached_forever(
+            self, asset_app, built):
+        _, manifest = built
+        url = '/assets/' + manifest['css_main']['path']
+
+        response = asset_app.test_client().get(
+            url, headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert 'immutable' in response.headers['Cache-Control']
+        assert response.mimetype == 'text/css'
+
+    def it_does_not_serve_files_outside_the_manifest(self, asset_app):
+        response = asset_app.test_client().get('/assets/manifest.json')
+
+        assert response.status_code == 404
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Test the read-through cache
+"""
+
+import datetime
+
+import mock
+import pytest
+
+from lib.cache import MISSING, Cache, LRUCache, RedisBackend
+
+
+class WhenCachingInProcess(object):
+
+    def it_evicts_the_least_recently_used_entry(self):
+        lru = LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        assert lru.get('b') is MISSING
+        assert lru.get('a') == 1
+
+    def it_expires_entries(self):
+        lru = LRUCache(ttl=5)
+
+        with mock.patch('lib.cache.time.monotonic', return_value=100):
+            lru.set('a', 1)
+
+        with mock.patch('lib.cache.time.monotonic', return_value=106):
+            assert lru.get('a') is MISSING
+
+
+class WhenReadingThrough(object):
+
+    def it_loads_once_until_deleted(self):
+        cache = Cache()
+        load = mock.Mock(return_value={'id': 1})
+
+        cache.get_or_set('key', load)
+        cache.get_or_set('key', load)
+        cache.delete('key')
+        cache.get_or_set('key', load)
+
+        assert load.call_count == 2
+
+    def it_does_not_cache_missing_values(self):
+        cache = Cache()
+        load = mock.Mock(return_value=None)
+
+        cache.get_or_set('key', load)
+        cache.get_or_set('key', load)
+
+        assert load.call_count == 2
+
+    def it_expires_local_entries_without_a_shared_backend(self, app):
+        cache = Cache()
+
+        with mock.patch.dict(app.config, {
+                'CACHE_TTL': 300, 'CACHE_LOCAL_TTL': 5}):
+            cache.init_app(app)
+
+        assert cache.shared is None
+        assert cache.local.ttl == 5
+
+
+class FakeRedis(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode('utf-8')
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.yield_fixture
+def redis_backend():
+    # XXX redis is optional, so stand in for the client
+    redis = mock.Mock()
+    redis.StrictRedis.from_url.return_value = FakeRedis()
+
+    with mock.patch.dict('sys.modules', {'redis': redis}):
+        yield RedisBackend('redis://localhost', ttl=60)
+
+
+class WhenSharingThroughRedis(object):
+
+    def it_keeps_timestamps_to_the_microsecond(self, redis_backend):
+        status = {'id': 1, 'created': datetime.datetime(
+            2016, 8, 1, 12, 0, 0, 123456)}
+
+        redis_backend.set('suit-status:1', status)
+
+        assert redis_backend.get('suit-status:1') == status
+
+    def it_reports_missing_keys(self, redis_backend):
+        assert redis_backend.get('suit-status:2') is MISSING
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Test cached OIDC provider discovery
+"""
+
+import json
+import os
+
+from jwkest.jwk import RSAKey, rsa_load
+from oic.oic import Client
+from oic.utils.authn.client import CLIENT_AUTHN_METHOD
+import mock
+import pytest
+
+from app.oidc_client.discovery import ProviderDiscovery
+from lib.private_dir import InsecureDirectory
+
+
+issuer = 'http://idp.example.com'
+
+
+class MockIdP(object):
+
+    def __init__(self, responses):
+        self.calls = []
+        self.keys = [RSAKey(key=rsa_load('signing_key.pem'), kid='key-1')]
+        self.etags = {}
+        self.down = False
+        responses.add_callback(
+            'GET', issuer + '/.well-known/openid-configuration',
+            self.respond(self.config))
+        responses.add_callback(
+            'GET', issuer + '/keys', self.respond(self.jwks))
+
+    def config(self):
+        return {
+            'issuer': issuer,
+            'authorization_endpoint': issuer + '/auth',
+            'token_endpoint': issuer + '/token',
+            'jwks_uri': issuer + '/keys',
+        }
+
+    def jwks(self):
+        return {'keys': [key.serialize() for key in self.keys]}
+
+    def respond(self, document):
+
+        def callback(request):
+            self.calls.append(request)
+
+            if self.down:
+                return (503, {}, '')
+
+            body = json.dumps(document())
+            etag = '"{}"'.format(hash(body))
+
+            if request.headers.get('If-None-Match') == etag:
+                return (304, {}, '')
+
+            return (200, {'ETag': etag}, body)
+
+        return callback
+
+
+@pytest.yield_fixture
+def idp(responses):
+    yield MockIdP(responses)
+
+    # XXX the mock is shared by the whole session
+    responses.remove('GET', issuer + '/.well-known/openid-configuration')
+    responses.remove('GET', issuer + '/keys')
+
+
+def discover(cache_dir, ttl=3600):
+    client = Client(client_authn_method=CLIENT_AUTHN_METHOD)
+    return ProviderDiscovery(client, issuer, str(cache_dir), ttl).load()
+
+
+def key_ids(discovery):
+    return [
+        key.kid
+        for bundle in discovery.client.keyjar.issuer_keys[issuer]
+        for key in bundle.keys()]
+
+
+class WhenDiscoveringAProvider(object):
+
+    def it_configures_endpoints_and_keys(self, idp, tmpdir):
+        discovery = discover(tmpdir)
+
+        assert discovery.client.authorization_endpoint == issuer + '/auth'
+        assert key_ids(discovery) == ['key-1']
+
+    def it_starts_from_the_cache_without_fetching(self, idp, tmpdir):
+        discover(tmpdir)
+        idp.calls = []
+
+        discovery = discover(tmpdir)
+
+        assert idp.calls == []
+        assert discovery.client.token_endpoint == issuer + '/token'
+
+    def it_revalidates_a_stale_cache_on_startup(self, idp, tmpdir):
+        discover(tmpdir, ttl=0)
+        idp.calls = []
+
+        discover(tmpdir, ttl=0)
+
+        assert len(idp.calls) == 2
+        assert all('If-None-Match' in call.headers for call in idp.calls)
+
+    def it_starts_from_a_stale_cache_if_the_provider_is_down(
+            self, idp, tmpdir):
+        discover(tmpdir, ttl=0)
+        idp.down = True
+
+        discovery = discover(tmpdir, ttl=0)
+
+        assert discovery.client.token_endpoint == issuer + '/token'
+
+    def it_revalidates_stale_documents(self, idp, tmpdir):
+        discovery = discover(tmpdir, ttl=0)
+        idp.calls = []
+
+        discovery.refresh()
+
+        assert len(idp.calls) == 2
+        assert all('If-None-Match' in call.headers for call in idp.calls)
+
+    def it_picks_up_rotated_keys(self, idp, tmpdir):
+        discovery = discover(tmpdir, ttl=0)
+        idp.keys = [RSAKey(key=rsa_load('signing_key.pem'), kid='key-2')]
+
+        discovery.refresh()
+
+        assert key_ids(discovery) == ['key-2']
+
+    def it_refuses_a_cache_other_users_can_write_to(self, tmpdir):
+        tmpdir.chmod(0o777)
+
+        with pytest.raises(InsecureDirectory):
+            discover(tmpdir)
+
+
+class WhenRefreshingInTheBackground(object):
+
+    def it_starts_one_thread_per_process(self, idp, tmpdir):
+        discovery = discover(tmpdir)
+        discovery.start(3600)
+        thread = discovery._thread
+
+        discovery.start(3600)
+        assert discovery._thread is thread
+
+        # XXX as in a worker forked after the thread started
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            discovery.start(3600)
+
+        assert discovery._thread is not thread
+        assert discovery._thread.is_alive()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Test installing GOV.UK assets from local archives
+"""
+
+import copy
+import os
+import zipfile
+
+import mock
+import pytest
+
+from lib import govuk_assets
+
+
+ARCHIVES = {
+    'frontend_toolkit': {
+        'govuk_frontend_toolkit-master/stylesheets/_colours.scss': '',
+        'govuk_frontend_toolkit-master/images/logo.png': '',
+        'govuk_frontend_toolkit-master/javascripts/govuk.js': '',
+    },
+    'elements': {
+        'govuk_elements-master/public/sass/_elements.scss': '',
+    },
+    'template': {
+        'govuk_template-master/.ruby-version': '2.3',
+        'govuk_template-master/source/template.erb': '',
+    },
+}
+
+
+def make_zip(path, files):
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+
+
+def fake_compile_template(master_dir):
+    pkg_dir = os.path.join(master_dir, 'pkg', 'jinja_govuk_template-0.1')
+
+    for name in ('assets', 'views/layouts'):
+        os.makedirs(os.path.join(pkg_dir, name))
+
+    with open(os.path.join(pkg_dir, 'views/layouts/govuk.html'), 'w') as f:
+        f.write('{% block content %}{% endblock %}')
+
+
+@pytest.yield_fixture
+def archives(tmpdir):
+    metadata = copy.deepcopy(govuk_assets.package_metadata)
+
+    for package, files in ARCHIVES.items():
+        path = str(tmpdir.join('{}.zip'.format(package)))
+        make_zip(path, files)
+        metadata[package]['url'] = 'file://' + path
+
+    with mock.patch.object(govuk_assets, 'package_metadata', metadata):
+        yield metadata
+
+
+@pytest.yield_fixture
+def compile_template():
+    with mock.patch.object(
+            govuk_assets, 'compile_template',
+            side_effect=fake_compile_template) as compile_template:
+        yield compile_template
+
+
+@pytest.fixture
+def install(tmpdir, archives, compile_template):
+    app_dir = str(tmpdir.join('app'))
+    cache_dir = str(tmpdir.join('cache'))
+
+    def install():
+        govuk_assets.install_govuk_assets(app_dir, cache_dir=cache_dir)
+        return app_dir
+
+    return install
+
+
+class WhenInstallingGovukAssets(object):
+
+    def it_installs_every_package(self, install):
+        app_dir = install()
+
+        for path in (
+                'static/govuk_frontend_toolkit/stylesheets/_colours.scss',
+                'static/govuk_elements/public/sass/_elements.scss',
+                'static/govuk_template/assets',
+                'templates/govuk_template/views/layouts/govuk.html'):
+            assert os.path.exists(os.path.join(app_dir, path))
+
+    def it_reuses_the_compiled_template(self, install, compile_template):
+        app_dir = install()
+        govuk_assets.remove_govuk_assets(app_dir)
+        install()
+
+        assert compile_template.call_count == 1
+        assert os.path.exists(os.path.join(
+            app_dir, 'templates/govuk_template/views/layouts/govuk.html'))
+
+    def it_uses_cached_archives_when_offline(self, install, archives):
+        app_dir = install()
+        govuk_assets.remove_govuk_assets(app_dir)
+
+        for package in archives.values():
+            os.unlink(package['url'][len('file://'):])
+
+        install()
+
+        assert os.path.isdir(os.path.join(app_dir, 'static/govuk_elements'))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Test queued logging
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+from lib.log_queue import JSONFormatter, queue_handlers
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.threads = []
+        self.messages = []
+
+    def emit(self, record):
+        self.threads.append(threading.current_thread())
+        self.messages.append(self.format(record))
+
+
+@pytest.yield_fixture
+def queued_logger():
+    logger = logging.getLogger('tests.log_queue')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = RecordingHandler()
+    logger.handlers = [handler]
+
+    logger.queued, = queue_handlers(['tests.log_queue'])
+    logger.recorded = handler
+
+    yield logger
+
+    logger.queued.stop()
+    logger.handlers = []
+
+
+class WhenLoggingThroughAQueue(object):
+
+    def it_writes_records_on_another_thread(self, queued_logger):
+        queued_logger.info('Redirecting to %s', '/start')
+        queued_logger.queued.stop()
+
+        handler = queued_logger.recorded
+        assert handler.messages == ['Redirecting to /start']
+        assert handler.threads[0] is not threading.current_thread()
+
+    def it_respects_handler_levels(self, queued_logger):
+        queued_logger.recorded.setLevel(logging.WARNING)
+
+        queued_logger.info('ignored')
+        queued_logger.warning('kept')
+        queued_logger.queued.stop()
+
+        assert queued_logger.recorded.messages == ['kept']
+
+    def it_keeps_logging_after_a_fork(self, queued_logger, tmpdir):
+        handler = logging.FileHandler(str(tmpdir.join('worker.log')))
+        queued_logger.queued.targets = (handler,)
+
+        # XXX the first record is taken off the queue and held up at the
+        # gate, the second is still queued when the process forks
+        gate = threading.Event()
+        handler.addFilter(lambda record: gate.wait())
+        queued_logger.info('first from the parent')
+        queued_logger.info('second from the parent')
+
+        pid = os.fork()
+
+        if pid == 0:
+            gate.set()
+            queued_logger.info('from the worker')
+            queued_logger.queued.stop()
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        gate.set()
+        queued_logger.queued.stop()
+        handler.close()
+
+        lines = tmpdir.join('worker.log').read().splitlines()
+        assert sorted(lines) == [
+            'first from the parent', 'from the worker',
+            'second from the parent']
+
+
+class WhenFormattingAsJSON(object):
+
+    def it_includes_extra_fields(self):
+        stream = io.StringIO()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JSONFormatter())
+        logger = logging.getLogger('tests.log_queue.json')
+        logger.propagate = False
+        logger.handlers = [handler]
+
+        logger.warning('Suit %d rejected', 7, extra={'suit': 7})
+
+        entry = json.loads(stream.getvalue())
+        assert entry['message'] == 'Suit 7 rejected'
+        assert entry['level'] == 'WARNING'
+        assert entry['logger'] == 'tests.log_queue.json'
+        assert entry['suit'] == 7
+        assert entry['time'].endswith('Z')
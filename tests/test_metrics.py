@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Test Prometheus metrics
+"""
+
+from flask import Flask
+import mock
+import pytest
+import requests
+import responses
+
+from lib.prometheus_metrics import Metrics, mark_process_dead
+
+
+@pytest.fixture
+def metrics_app():
+    app = Flask(__name__)
+    app.config['METRICS_URL'] = '/metrics'
+
+    @app.route('/hello')
+    def hello():
+        return 'hello'
+
+    @app.route('/broken')
+    def broken():
+        raise ValueError('broken')
+
+    app.metrics = Metrics(app)
+    return app
+
+
+def sample(metrics, name, **labels):
+    return metrics.registry.get_sample_value(name, labels)
+
+
+class WhenRecordingRequests(object):
+
+    def it_times_requests_per_endpoint(self, metrics_app):
+        client = metrics_app.test_client()
+        client.get('/hello')
+        client.get('/hello')
+
+        metrics = metrics_app.metrics
+
+        assert sample(
+            metrics, 'http_request_duration_seconds_count',
+            endpoint='hello', method='GET') == 2
+        assert sample(
+            metrics, 'http_requests_total',
+            endpoint='hello', method='GET', status='200') == 2
+
+    def it_counts_unhandled_exceptions(self, metrics_app):
+        metrics_app.test_client().get('/broken')
+
+        assert sample(
+            metrics_app.metrics, 'http_request_exceptions_total',
+            endpoint='broken') == 1
+
+    def it_serves_the_text_format(self, metrics_app):
+        client = metrics_app.test_client()
+        client.get('/hello')
+
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert b'http_request_duration_seconds_bucket{' in response.data
+
+    def it_only_serves_internal_networks(self, metrics_app):
+        response = metrics_app.test_client().get(
+            '/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+
+        assert response.status_code == 403
+
+    def it_marks_the_exiting_process_dead(self):
+
+        with mock.patch('lib.prometheus_metrics.os.getpid', return_value=42), \
+                mock.patch('lib.prometheus_metrics.multiprocess') as mp:
+            mark_process_dead()
+
+        mp.mark_process_dead.assert_called_once_with(42)
+
+
+class WhenRecordingExternalCalls(object):
+
+    def it_counts_errors(self):
+        metrics = Metrics()
+
+        with pytest.raises(IOError):
+            with metrics.external_timer('oidc', 'token'):
+                raise IOError('timed out')
+
+        assert sample(
+            metrics, 'external_request_errors_total',
+            service='oidc', operation='token') == 1
+        assert sample(
+            metrics, 'external_request_duration_seconds_count',
+            service='oidc', operation='token') == 1
+
+    def it_ignores_expected_exceptions(self):
+        metrics = Metrics()
+
+        with pytest.raises(KeyError):
+            with metrics.external_timer('oidc', 'userinfo', KeyError):
+                raise KeyError('userinfo_endpoint')
+
+        assert sample(
+            metrics, 'external_request_errors_total',
+            service='oidc', operation='userinfo') is None
+
+    @responses.activate
+    def it_times_session_requests(self):
+        metrics = Metrics()
+        session = metrics.instrument_session(requests.Session(), 'pay')
+        responses.add(responses.GET, 'http://pay.test/', status=503)
+
+        session.get('http://pay.test/')
+
+        assert sample(
+            metrics, 'external_request_duration_seconds_count',
+            service='pay', operation='GET') == 1
+        assert sample(
+            metrics, 'external_request_errors_total',
+            service='pay', operation='GET') == 1
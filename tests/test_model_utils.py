@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Test model util mixins
+"""
+
+import threading
+
+from flask import url_for
+import mock
+import pytest
+
+from app.extensions import db
+from app.main.models import Suit, User
+from lib.model_utils import _load_row, unit_of_work
+
+
+@pytest.yield_fixture
+def commits(db_session):
+    with mock.patch.object(
+            db.session, 'commit', wraps=db.session.commit) as commit:
+        yield commit
+
+
+class WhenWorkingInAUnitOfWork(object):
+
+    def it_commits_once(self, commits):
+        with unit_of_work():
+            user, _ = User.get_or_create(email='plaintiff@example.com')
+            brother, _ = User.get_or_create(name='Brother')
+            brother.update(mobile='07700900000')
+
+        assert commits.call_count == 1
+
+    def it_assigns_ids_before_committing(self, commits):
+        with unit_of_work():
+            user, created = User.get_or_create(email='plaintiff@example.com')
+
+            assert created
+            assert user.id is not None
+            assert not commits.called
+
+    def it_commits_only_the_outermost_block(self, commits):
+        with unit_of_work():
+            with unit_of_work():
+                User.get_or_create(email='plaintiff@example.com')
+
+            assert not commits.called
+
+        assert commits.call_count == 1
+
+    def it_rolls_back_on_error(self, commits):
+        with pytest.raises(ValueError):
+            with unit_of_work():
+                User.get_or_create(email='plaintiff@example.com')
+                raise ValueError()
+
+        assert not commits.called
+        assert User.query.filter_by(email='plaintiff@example.com').count() \
+            == 0
+
+    def it_still_commits_outside_a_unit_of_work(self, commits):
+        User.get_or_create(email='plaintiff@example.com')
+
+        assert commits.call_count == 1
+
+
+class WhenGettingOrCreating(object):
+
+    def it_creates_a_missing_row(self, db_session):
+        user, created = User.get_or_create(email='new@example.com')
+
+        assert created
+        assert user.email == 'new@example.com'
+
+    def it_finds_an_existing_row(self, test_user):
+        user, created = User.get_or_create(email=test_user.email)
+
+        assert not created
+        assert user.id == test_user.id
+
+    def it_tolerates_duplicate_non_unique_values(self, db_session):
+        db_session.add_all([User(name='Brother'), User(name='Brother')])
+        db_session.commit()
+
+        brother, created = User.get_or_create(name='Brother')
+
+        assert not created
+
+    def it_adds_a_returned_row_to_the_session(self, test_user):
+        row = db.session.execute(User.__table__.select().where(
+            User.id == test_user.id)).first()
+        db.session.expunge_all()
+
+        user = _load_row(User, row)
+        user.name = 'Renamed'
+        db.session.commit()
+
+        assert User.query.get(test_user.id).name == 'Renamed'
+        assert User.query.count() == 1
+
+
+@pytest.yield_fixture
+def threaded_db(app, db):
+    # each thread needs its own connection, unlike db_session
+    old_session = db.session
+    db.session = db.create_scoped_session()
+
+    yield db
+
+    Suit.query.delete()
+    User.query.delete()
+    db.session.commit()
+    db.session.remove()
+    db.session = old_session
+
+
+@pytest.mark.usefixtures('threaded_db')
+class WhenManyRequestsStartSuitsAtOnce(object):
+    threads = 8
+    requests_per_thread = 5
+
+    def it_creates_one_plaintiff(self, app):
+        start_suit_url = url_for('main.start_suit')
+        errors = []
+
+        def start_suits(n):
+            client = app.test_client()
+
+            with client.session_transaction() as session:
+                session['user'] = {
+                    'email': 'racer@example.com',
+                    'name': 'Racer',
+                    'mobile': None}
+
+            for i in range(self.requests_per_thread):
+
+                try:
+                    response = client.post(
+                        start_suit_url, data={'brothers_name': 'Brother'})
+
+                except Exception as e:
+                    errors.append(e)
+
+                else:
+                    if response.status_code != 302:
+                        errors.append(response.status_code)
+
+        threads = [
+            threading.Thread(target=start_suits, args=(n,))
+            for n in range(self.threads)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert User.query.filter_by(email='racer@example.com').count() == 1
+        assert Suit.query.count() == self.threads * self.requests_per_thread
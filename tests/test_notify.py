@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Test queued GOV.UK Notify messages
+"""
+
+import datetime
+
+import mock
+import pytest
+
+from app.main.models import OutboundNotification
+from app.main.tasks import dispatch_notifications
+from lib.notify import Notification, Notify
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.yield_fixture
+def notify(db_session):
+    client = Notify()
+    client.base_url = 'http://notify.example.com'
+    client._outbox_class = OutboundNotification
+    client.notifications['sms'] = Notification(client, 'sms-template')
+
+    with mock.patch.object(client, 'post'), \
+            mock.patch('app.main.tasks.notify', client):
+        yield client
+
+
+@pytest.fixture
+def queued(notify, db_session):
+    notify['sms'].queue_sms('07700900000', plaintiff='Test')
+    db_session.commit()
+    return OutboundNotification.query.one()
+
+
+class WhenQueueingANotification(object):
+
+    def it_does_not_send_it(self, notify, queued):
+        assert not notify.post.called
+
+    def it_stores_the_request(self, queued):
+        assert queued.endpoint == '/notifications/sms'
+        assert queued.data == {
+            'template': 'sms-template',
+            'to': '07700900000',
+            'personalisation': {'plaintiff': 'Test'}}
+
+    def it_builds_a_separate_payload_per_message(self, notify):
+        sms = notify['sms']
+
+        first = sms.payload('07700900000', {'plaintiff': 'First'})
+        second = sms.payload('07700900001')
+
+        assert first['to'] == '07700900000'
+        assert second == {'template': 'sms-template', 'to': '07700900001'}
+
+
+class WhenDispatchingQueuedNotifications(object):
+
+    def it_sends_due_messages(self, notify, queued):
+        assert dispatch_notifications() == 1
+
+        notify.post.assert_called_once_with(
+            '/notifications/sms', data=queued.data)
+        assert queued.sent is not None
+
+    def it_skips_sent_messages(self, notify, queued):
+        dispatch_notifications()
+
+        assert dispatch_notifications() == 0
+        assert notify.post.call_count == 1
+
+    def it_backs_off_after_a_failure(self, notify, queued):
+        notify.post.side_effect = HTTPError(503)
+        before = datetime.datetime.utcnow()
+
+        dispatch_notifications()
+
+        assert queued.sent is None
+        assert queued.attempts == 1
+        assert queued.next_attempt >= before + datetime.timedelta(
+            seconds=OutboundNotification.backoff_base)
+        assert dispatch_notifications() == 0
+
+    def it_gives_up_on_client_errors(self, notify, queued):
+        notify.post.side_effect = HTTPError(400)
+
+        dispatch_notifications()
+
+        assert queued.failed
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Test the mock OpenID Connect provider's HTTP server
+"""
+
+import json
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import HTTPErrorProcessor, build_opener
+
+from jwkest.jws import JWS
+import pytest
+
+from tests.oidc_testbed import (
+    IdTokenSigner, OIDCProviderServer, load_signing_key)
+
+
+class NoRedirects(HTTPErrorProcessor):
+
+    def http_response(self, request, response):
+        return response
+
+
+# XXX urllib rather than requests, which `responses` may be patching
+opener = build_opener(NoRedirects)
+
+
+def fetch(url, data=None):
+    if data is not None:
+        data = urlencode(data).encode('utf-8')
+
+    return opener.open(url, data)
+
+
+@pytest.yield_fixture
+def server():
+    with OIDCProviderServer(token_pool_size=10) as server:
+        yield server
+
+
+def sign_in(server):
+    response = fetch('{}/auth?{}'.format(server.url, urlencode({
+        'client_id': 'test-client',
+        'response_type': 'code',
+        'scope': 'openid',
+        'redirect_uri': 'http://localhost:5000/oidc_callback',
+        'state': 'state',
+        'nonce': 'nonce',
+    })))
+    query = parse_qs(urlparse(response.headers['Location']).query)
+
+    response = fetch(server.url + '/token', {
+        'grant_type': 'authorization_code',
+        'code': query['code'][0],
+        'redirect_uri': 'http://localhost:5000/oidc_callback',
+    })
+
+    return json.loads(response.read().decode('utf-8'))
+
+
+class WhenSigningIdTokens(object):
+
+    def it_signs_tokens_jwkest_can_verify(self):
+        token = IdTokenSigner().sign({'sub': 'test-sub', 'nonce': 'abc'})
+
+        claims = JWS().verify_compact(token, [load_signing_key()])
+
+        assert claims == {'sub': 'test-sub', 'nonce': 'abc'}
+
+
+class WhenServingOverHTTP(object):
+
+    def it_serves_discovery_metadata(self, server):
+        response = fetch(server.url + '/.well-known/openid-configuration')
+        metadata = json.loads(response.read().decode('utf-8'))
+
+        assert metadata['issuer'] == server.url
+        assert metadata['token_endpoint'] == server.url + '/token'
+
+    def it_signs_in_a_new_user_each_time(self, server):
+        first = sign_in(server)
+        second = sign_in(server)
+
+        subjects = [
+            JWS().verify_compact(tokens['id_token'], [load_signing_key()])[
+                'sub'] for tokens in (first, second)]
+
+        assert subjects == ['user-0', 'user-1']
+
+    def it_returns_userinfo_for_the_token(self, server):
+        tokens = sign_in(server)
+
+        response = fetch(server.url + '/userinfo', {
+            'access_token': tokens['access_token']})
+        userinfo = json.loads(response.read().decode('utf-8'))
+
+        assert userinfo['email'] == 'user-0@example.com'
+
+    def it_delays_responses(self, server):
+        server.latency = 0.05
+        start = time.perf_counter()
+
+        fetch(server.url + '/keys')
+
+        assert time.perf_counter() - start >= 0.05
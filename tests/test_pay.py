@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Test GOV.UK Pay client
+"""
+
+import functools
+
+import mock
+import pytest
+import requests
+
+from app.main.models import Payment
+from app.main.tasks import reconcile_payments
+from lib.pay import Pay
+from lib.prometheus_metrics import Metrics
+
+
+payment_url = 'http://pay.example.com/v1/payments/abc123'
+
+payment_json = {
+    'payment_provider': 'sandbox',
+    'state': {'status': 'created', 'finished': False},
+    'description': 'Test payment',
+    'created_date': '2016-08-01T12:00:00.000Z',
+    '_links': {
+        'self': {'href': payment_url},
+        'next_url': {'href': 'http://pay.example.com/pay/abc123'},
+    },
+}
+
+
+def response(status_code, json):
+    r = mock.Mock(status_code=status_code)
+    r.json.return_value = json
+    return r
+
+
+@pytest.yield_fixture
+def pay(db_session):
+    client = Pay()
+    client.base_url = 'http://pay.example.com'
+    client.api_key = 'test-key'
+    client._payment_class = Payment
+
+    with mock.patch.object(client.session, 'request') as request:
+        yield client, request
+
+
+class WhenCreatingAPayment(object):
+
+    def it_sends_requests_with_timeouts(self, pay):
+        client, request = pay
+        request.return_value = response(201, payment_json)
+
+        client.create_payment(100, 'Test payment', 'http://return', 'ref1')
+
+        assert request.call_args[1]['timeout'] == client.timeout
+
+    def it_records_latency_per_endpoint(self, pay):
+        client, request = pay
+        request.return_value = response(201, payment_json)
+        metrics = Metrics()
+        client.timer = functools.partial(metrics.external_timer, 'pay')
+
+        client.create_payment(100, 'Test payment', 'http://return', 'ref2')
+
+        assert metrics.registry.get_sample_value(
+            'external_request_duration_seconds_count',
+            {'service': 'pay', 'operation': 'create_payment'}) == 1
+
+    def it_recovers_a_payment_created_before_a_timeout(self, pay):
+        client, request = pay
+        request.side_effect = [
+            requests.Timeout(),
+            response(200, {'results': [payment_json]}),
+            response(200, payment_json),
+        ]
+
+        payment = client.create_payment(
+            100, 'Test payment', 'http://return', 'ref3')
+
+        assert payment.url == payment_url
+        search = request.call_args_list[1]
+        assert search[1]['params'] == {'reference': 'ref3'}
+        assert request.call_count == 3
+
+    def it_retries_if_no_payment_was_created(self, pay):
+        client, request = pay
+        request.side_effect = [
+            requests.ConnectionError(),
+            response(200, {'results': []}),
+            response(201, payment_json),
+        ]
+
+        payment = client.create_payment(
+            100, 'Test payment', 'http://return', 'ref4')
+
+        assert payment.url == payment_url
+        assert request.call_args_list[2][0][0] == 'POST'
+
+
+@pytest.fixture
+def unfinished_payments(db_session):
+    payments = [
+        Payment(
+            reference='ref{}'.format(i),
+            url='{}/{}'.format(payment_url, i),
+            finished=False)
+        for i in range(5)]
+    db_session.add_all(payments)
+    db_session.commit()
+    return payments
+
+
+class WhenReconcilingPayments(object):
+
+    def it_updates_every_unfinished_payment(self, unfinished_payments):
+        state = {'status': 'success', 'finished': True}
+
+        with mock.patch('app.main.tasks.pay') as pay:
+            pay.fetch_state.return_value = state
+            stats = reconcile_payments(chunk_size=2, max_workers=2)
+
+        assert stats['checked'] == 5
+        assert stats['updated'] == 5
+        assert Payment.query.filter_by(finished=True).count() == 5
+
+    def it_counts_failed_lookups(self, unfinished_payments):
+        state = {'status': 'started', 'finished': False}
+
+        def fetch_state(url):
+            if url.endswith('/3'):
+                raise requests.ConnectionError()
+            return state
+
+        with mock.patch('app.main.tasks.pay') as pay, \
+                mock.patch('app.main.tasks.logger') as logger:
+            pay.fetch_state.side_effect = fetch_state
+            stats = reconcile_payments(chunk_size=2, max_workers=2)
+
+        assert stats['errors'] == 1
+        assert logger.exception.call_count == 1
+        assert stats['updated'] == 4
+        assert Payment.query.filter_by(status='started').count() == 4
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Test private directories
+"""
+
+import os
+import stat
+
+import mock
+import pytest
+
+from lib.private_dir import InsecureDirectory, make_private_dir
+
+
+def mode(path):
+    return stat.S_IMODE(os.lstat(path).st_mode)
+
+
+class WhenMakingAPrivateDirectory(object):
+
+    def it_creates_it_for_this_user_only(self, tmpdir):
+        path = make_private_dir(str(tmpdir.join('cache')))
+
+        assert mode(path) == 0o700
+
+    def it_accepts_an_existing_private_directory(self, tmpdir):
+        path = make_private_dir(str(tmpdir.join('cache')))
+
+        assert make_private_dir(path) == path
+
+    def it_refuses_a_directory_open_to_other_users(self, tmpdir):
+        path = str(tmpdir.join('cache'))
+        os.mkdir(path)
+        os.chmod(path, 0o777)
+
+        with pytest.raises(InsecureDirectory):
+            make_private_dir(path)
+
+        assert mode(path) == 0o777
+
+    def it_refuses_a_directory_owned_by_another_user(self, tmpdir):
+        path = make_private_dir(str(tmpdir.join('cache')))
+
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+
+            with pytest.raises(InsecureDirectory):
+                make_private_dir(path)
+
+    def it_refuses_a_symlink(self, tmpdir):
+        target = make_private_dir(str(tmpdir.join('target')))
+        path = str(tmpdir.join('cache'))
+        os.symlink(target, path)
+
+        with pytest.raises(InsecureDirectory):
+            make_private_dir(path)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Test in-process publish/subscribe
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+import pytest
+
+from lib.pubsub import PostgresRelay, PubSub, SubscriberLimitReached
+from tests.conftest import TEST_DATABASE_URI
+
+
+class WhenPublishing(object):
+
+    def it_fans_out_to_every_waiting_thread(self):
+        pubsub = PubSub()
+        subscriptions = [pubsub.subscribe('suit:1') for _ in range(5)]
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            waiting = [executor.submit(s.get, 5) for s in subscriptions]
+            delivered = pubsub.publish('suit:1', 'accepted')
+            received = [future.result() for future in waiting]
+
+        assert delivered == 5
+        assert received == ['accepted'] * 5
+
+    def it_only_reaches_subscribers_of_the_channel(self):
+        pubsub = PubSub()
+
+        with pubsub.subscribe('suit:1') as subscription:
+            pubsub.publish('suit:2', 'accepted')
+
+            assert subscription.get(timeout=0) is None
+
+        assert pubsub.subscriber_count('suit:1') == 0
+
+    def it_drops_messages_for_subscribers_too_far_behind(self):
+        pubsub = PubSub(maxsize=1)
+        subscription = pubsub.subscribe('suit:1')
+
+        assert pubsub.publish('suit:1', 'paid') == 1
+        assert pubsub.publish('suit:1', 'confirmed') == 0
+        assert subscription.get(timeout=0) == 'paid'
+
+    def it_publishes_to_many_channels_at_once(self):
+        pubsub = PubSub()
+
+        with pubsub.subscribe(1) as first, pubsub.subscribe(2) as second:
+            delivered = pubsub.publish_many([1, 2, 3], 'accepted')
+
+            assert delivered == 2
+            assert first.get(timeout=0) == second.get(timeout=0) == 'accepted'
+
+    def it_limits_subscribers_per_process(self):
+        pubsub = PubSub(max_subscribers=1)
+
+        with pubsub.subscribe('suit:1'):
+
+            with pytest.raises(SubscriberLimitReached):
+                pubsub.subscribe('suit:2')
+
+        pubsub.subscribe('suit:2').close()
+
+
+@pytest.mark.skipif(
+    not TEST_DATABASE_URI.startswith('postgres'),
+    reason='needs Postgres LISTEN/NOTIFY')
+class WhenRelayingThroughPostgres(object):
+
+    def it_reaches_subscribers_of_another_pubsub(self):
+        listener, sender = PubSub(), PubSub()
+        listener.relay = PostgresRelay(TEST_DATABASE_URI, listener)
+        sender.relay = PostgresRelay(TEST_DATABASE_URI, sender)
+
+        with listener.subscribe(1) as subscription:
+            sender.publish(1, 'accepted')
+
+            assert subscription.get(timeout=5) == 'accepted'
+
+    def it_relays_a_batch_on_one_connection(self):
+        listener, sender = PubSub(), PubSub()
+        listener.relay = PostgresRelay(TEST_DATABASE_URI, listener)
+        sender.relay = PostgresRelay(TEST_DATABASE_URI, sender)
+        sender.relay.channels_per_notify = 2
+
+        with listener.subscribe(1) as first, listener.subscribe(3) as third:
+
+            with mock.patch.object(
+                    sender.relay.engine, 'connect',
+                    wraps=sender.relay.engine.connect) as connect:
+                sender.publish_many([1, 2, 3], 'rejected')
+
+            assert connect.call_count == 1
+            assert first.get(timeout=5) == 'rejected'
+            assert third.get(timeout=5) == 'rejected'
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Test per-endpoint query instrumentation
+"""
+
+from flask import Flask
+import mock
+import pytest
+from sqlalchemy import create_engine
+
+from lib.query_stats import QueryBudgetExceeded, QueryStats, query_budget
+
+
+@pytest.fixture
+def engine():
+    return create_engine('sqlite://')
+
+
+@pytest.fixture
+def stats_app(engine):
+    app = Flask(__name__)
+    app.config.update(QUERY_STATS_URL='/metrics/queries', DEBUG=True)
+
+    @app.route('/one')
+    @query_budget(1)
+    def one():
+        engine.execute('SELECT 1')
+        return 'one'
+
+    @app.route('/three')
+    @query_budget(1)
+    def three():
+        for _ in range(3):
+            engine.execute('SELECT 1')
+        return 'three'
+
+    app.query_stats = QueryStats(app)
+    return app
+
+
+class WhenCountingQueries(object):
+
+    def it_reports_queries_in_a_header(self, stats_app):
+        response = stats_app.test_client().get('/one')
+
+        assert response.headers['X-Query-Stats'].startswith('count=1 ')
+
+    def it_totals_queries_per_endpoint(self, stats_app):
+        client = stats_app.test_client()
+        client.get('/one')
+        client.get('/one')
+
+        report = client.get('/metrics/queries').get_json()
+
+        assert report['one']['requests'] == 2
+        assert report['one']['queries'] == 2
+        assert report['one']['slowest_statement'] == 'SELECT 1'
+
+    def it_logs_views_over_budget(self, stats_app):
+
+        with mock.patch.object(stats_app.logger, 'warning') as warning:
+            response = stats_app.test_client().get('/three')
+
+        assert response.status_code == 200
+        message, = warning.call_args[0]
+        assert 'three' in message
+
+    def it_only_reports_to_internal_networks(self, stats_app):
+        response = stats_app.test_client().get(
+            '/metrics/queries', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+
+        assert response.status_code == 403
+
+    def it_fails_views_over_budget_when_strict(self, stats_app):
+        stats_app.config['QUERY_BUDGET_STRICT'] = True
+
+        with pytest.raises(QueryBudgetExceeded):
+            stats_app.test_client().get('/three')
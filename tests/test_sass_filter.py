@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Test the libsass compile cache
+"""
+
+import mock
+import pytest
+import sass
+
+from lib.sass_filter import LibSass
+
+
+@pytest.fixture
+def sources(tmpdir):
+    tmpdir.join('_colours.scss').write('$text: #0b0c0c;')
+    tmpdir.join('main.scss').write(
+        '@import "colours";\nbody { color: $text; }')
+    return tmpdir
+
+
+@pytest.fixture
+def make_filter(sources, tmpdir):
+
+    def make_filter():
+        sass_filter = LibSass(include_paths=[str(sources)])
+        sass_filter.cache_dir = str(tmpdir.join('cache'))
+        return sass_filter
+
+    return make_filter
+
+
+@pytest.yield_fixture
+def compile_calls():
+    with mock.patch('lib.sass_filter.sass.compile', wraps=sass.compile) as m:
+        yield m
+
+
+class WhenCompilingSass(object):
+
+    def it_skips_compiling_unchanged_inputs(
+            self, sources, make_filter, compile_calls):
+        sass_filter = make_filter()
+        src = sources.join('main.scss').read()
+
+        first = sass_filter._apply_sass(src)
+        second = sass_filter._apply_sass(src)
+
+        assert '#0b0c0c' in first
+        assert second == first
+        assert compile_calls.call_count == 1
+
+    def it_recompiles_when_an_import_changes(
+            self, sources, make_filter, compile_calls):
+        sass_filter = make_filter()
+        src = sources.join('main.scss').read()
+
+        sass_filter._apply_sass(src)
+        sources.join('_colours.scss').write('$text: #005ea5;')
+        css = sass_filter._apply_sass(src)
+
+        assert '#005ea5' in css
+        assert compile_calls.call_count == 2
+
+    def it_shares_the_cache_between_processes(
+            self, sources, make_filter, compile_calls):
+        src = sources.join('main.scss').read()
+
+        make_filter()._apply_sass(src)
+        make_filter()._apply_sass(src)
+
+        assert compile_calls.call_count == 1
+
+    def it_keys_the_cache_on_output_style(
+            self, sources, make_filter, compile_calls):
+        sass_filter = make_filter()
+        src = sources.join('main.scss').read()
+
+        expanded = sass_filter._apply_sass(src)
+        sass_filter.output_style = 'compressed'
+        compressed = sass_filter._apply_sass(src)
+
+        assert len(compressed) < len(expanded)
+        assert compile_calls.call_count == 2
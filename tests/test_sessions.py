@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Test server-side sessions
+"""
+
+import datetime
+
+from flask import url_for
+import pytest
+
+from app.main.models import StoredSession
+from lib.private_dir import InsecureDirectory
+from lib.server_session import FileSessionStore, ModelSessionStore
+
+
+@pytest.fixture
+def file_store(tmpdir):
+    return FileSessionStore(str(tmpdir))
+
+
+@pytest.fixture
+def model_store(db_session):
+    return ModelSessionStore(StoredSession)
+
+
+def expires_in(**kwargs):
+    return datetime.datetime.utcnow() + datetime.timedelta(**kwargs)
+
+
+class WhenUsingServerSideSessions(object):
+
+    def it_keeps_only_the_session_id_in_the_cookie(self, client):
+        with client.session_transaction() as session:
+            session['userinfo'] = {'name': 'x' * 4096}
+
+        cookie, = client.cookie_jar
+        assert len(cookie.value) < 100
+
+        with client.session_transaction() as session:
+            assert session['userinfo']['name'] == 'x' * 4096
+            session.clear()
+
+    def it_removes_the_session_once_empty(self, app, client):
+        with client.session_transaction() as session:
+            session['state'] = 'abc'
+
+        with client.session_transaction() as session:
+            sid = session.sid
+            session.pop('state')
+
+        assert app.session_interface.store.load(sid) is None
+        assert not list(client.cookie_jar)
+
+
+class WhenStoringSessions(object):
+
+    @pytest.mark.parametrize('store_name', ['file_store', 'model_store'])
+    def it_evicts_expired_sessions(self, request, store_name):
+        store = request.getfixturevalue(store_name)
+        store.save('live', '{}', expires_in(hours=1))
+        store.save('stale', '{}', expires_in(hours=-1))
+
+        assert store.load('stale') is None
+        assert store.purge() == 1
+        assert store.load('live')[0] == '{}'
+
+    def it_overwrites_a_saved_session(self, model_store):
+        model_store.save('sid', '{"a": 1}', expires_in(hours=1))
+        model_store.save('sid', '{"a": 2}', expires_in(hours=1))
+
+        assert model_store.load('sid')[0] == '{"a": 2}'
+
+    def it_refuses_a_directory_other_users_can_read(self, tmpdir):
+        tmpdir.chmod(0o755)
+
+        with pytest.raises(InsecureDirectory):
+            FileSessionStore(str(tmpdir))
+
+    def it_moves_a_rotated_session(self, model_store):
+        model_store.save('old', '{"a": 1}', expires_in(hours=1))
+        model_store.save('new', '{"a": 2}', expires_in(hours=1), 'old')
+
+        assert model_store.load('old') is None
+        assert model_store.load('new')[0] == '{"a": 2}'
+
+
+class WhenLoggingInAndOut(object):
+
+    def cookie(self, client):
+        cookie, = client.cookie_jar
+        return cookie.value
+
+    def it_issues_a_new_session_id_on_login(self, app, client, test_user):
+        with client.session_transaction() as session:
+            session['id_token'] = {'sub': test_user.email}
+            session['userinfo'] = {'email': test_user.email}
+
+        with client.session_transaction() as session:
+            old_sid = session.sid
+
+        before = self.cookie(client)
+
+        client.get(url_for('main.login'))
+
+        assert self.cookie(client) != before
+        assert app.session_interface.store.load(old_sid) is None
+
+        with client.session_transaction() as session:
+            assert session['userinfo'] == {'email': test_user.email}
+            session.clear()
+
+    def it_issues_a_new_session_id_on_logout(self, client, test_user):
+        with client.session_transaction() as session:
+            session['user_id'] = test_user.id
+            session['state'] = 'abc'
+
+        before = self.cookie(client)
+
+        client.get(url_for('main.logout'))
+
+        assert self.cookie(client) != before
+
+        with client.session_transaction() as session:
+            assert 'user_id' not in session
+            session.clear()
@@ -3,11 +3,22 @@
 Test user flow
 """
 
+from datetime import datetime
+import json
+
 import pytest
 from bs4 import BeautifulSoup
-from flask import url_for
+from flask import g, url_for
+from flask_principal import identity_loaded
+import mock
 from mock import Mock
 
+from app.extensions import suit_events
+from app.main.models import AnonymousUser, Suit, User
+from app.main.views import (
+    current_suit, forget_suit_status, reset_request_cache, status_events,
+    suit_changed)
+
 
 mock_openid_config = Mock()
 mock_openid_config.return_value = {
@@ -111,3 +122,155 @@ class WhenNavigatingToAdminUsers(object):
 
         assert "example.com" in response.headers['Location']
         assert response.status_code == 302
+
+
+@pytest.fixture
+def request_cache():
+    reset_request_cache()
+
+
+class WhenStartingARequest(object):
+
+    def it_forgets_the_last_user_before_loading_permissions(
+            self, app, client, login, test_user):
+        login(test_user)
+        g.current_user = Mock(is_superadmin=True)
+        granted = []
+
+        def record(sender, identity):
+            granted.append(g.get('current_user'))
+
+        identity_loaded.connect(record, app)
+
+        try:
+            client.get(url_for('main.index'))
+
+        finally:
+            identity_loaded.disconnect(record, app)
+
+        assert granted[0] is test_user
+
+
+@pytest.mark.usefixtures('request_cache')
+class WhenLookingUpTheCurrentSuit(object):
+
+    def it_finds_the_newest_suit_by_email(self, db_session, test_user):
+        older = Suit(plaintiff=test_user, created=datetime(2016, 8, 1))
+        newer = Suit(plaintiff=test_user, created=datetime(2016, 8, 2))
+        db_session.add_all([older, newer])
+        db_session.commit()
+
+        user = AnonymousUser()
+        user.update(email=test_user.email)
+
+        assert current_suit(user) is newer
+
+    def it_finds_nothing_for_an_anonymous_user_without_an_email(
+            self, db_session):
+        unnamed = User(name='No Email')
+        db_session.add(Suit(plaintiff=unnamed, defendant=User(name='Bro')))
+        db_session.commit()
+
+        assert current_suit(AnonymousUser()) is None
+
+    def it_queries_once_per_request(self, db_session, test_user):
+        assert current_suit(test_user) is None
+
+        db_session.add(Suit(plaintiff=test_user))
+        db_session.commit()
+
+        assert current_suit(test_user) is None
+
+
+@pytest.fixture
+def suit(db_session, test_user):
+    defendant = User(email='brother@example.com', name='Brother')
+    suit = Suit(plaintiff=test_user, defendant=defendant)
+    db_session.add(suit)
+    db_session.commit()
+    return suit
+
+
+class WhenCheckingSuitStatus(object):
+
+    def it_sends_not_modified_while_the_suit_is_unchanged(self, client, suit):
+        url = url_for('main.status', suit=suit.id)
+        first = client.get(url)
+        etag = first.headers['ETag']
+
+        response = client.get(url, headers={'If-None-Match': etag})
+
+        assert first.status_code == 200
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+    def it_renders_again_once_the_suit_changes(
+            self, client, db_session, suit):
+        url = url_for('main.status', suit=suit.id)
+        etag = client.get(url).headers['ETag']
+
+        suit.accepted = datetime.utcnow()
+        db_session.commit()
+        forget_suit_status(suit.id)
+        response = client.get(url, headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert 'Accepted for review' in response.get_data(as_text=True)
+
+    def it_serves_repeat_polls_from_the_cache(self, client, db_session, suit):
+        url = url_for('main.status', suit=suit.id)
+        client.get(url)
+
+        suit.defendant.name = 'Renamed'
+        db_session.commit()
+
+        assert 'Brother' in client.get(url).get_data(as_text=True)
+
+
+def read_event(events):
+    lines = next(events).decode('utf-8').splitlines()
+    fields = dict(line.split(': ', 1) for line in lines if line)
+    return fields['event'], json.loads(fields['data'])
+
+
+class WhenWaitingForSuitStatus(object):
+
+    def it_pushes_changes_to_the_suit(self, app, client, db_session, suit):
+        response = client.get(
+            url_for('main.status_events', suit=suit.id), buffered=False)
+        events = iter(response.response)
+        next(events)
+
+        assert response.mimetype == 'text/event-stream'
+        assert read_event(events) == (
+            'status', {'status': 'Awaiting payment confirmation',
+                       'final': False})
+
+        # the stream let go of the session the suit was loaded in
+        Suit.query.get(suit.id).accepted = datetime.utcnow()
+        db_session.commit()
+        suit_changed(suit.id, 'accepted')
+
+        assert read_event(events) == (
+            'status', {'status': 'Accepted for review', 'final': True})
+        assert next(events, None) is None
+
+    def it_frees_the_stream_if_it_is_never_read(self, app, suit):
+        response = status_events(suit.id)
+        assert suit_events.subscriber_count(suit.id) == 1
+
+        response.close()
+
+        assert suit_events.subscriber_count(suit.id) == 0
+
+    def it_falls_back_to_polling_past_the_stream_limit(
+            self, app, client, suit):
+
+        with mock.patch.object(suit_events, 'max_subscribers', 0):
+            response = client.get(
+                url_for('main.status_events', suit=suit.id))
+
+        assert response.mimetype == 'text/event-stream'
+        assert response.get_data(as_text=True).startswith('retry: 10000\n\n')
+        assert 'Awaiting payment confirmation' in response.get_data(
+            as_text=True)